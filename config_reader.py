@@ -27,6 +27,7 @@ class ConfigReader(object):
         self.argsdict['vrconf']  = ''
         self.argsdict['topology'] = ''
         self.argsdict['rtable'] = ''
+        self.argsdict['rcache'] = ''
         self.argsdict['ihandler'] = ''
         self.argsdict['upperapp'] = ''
         self.argsdict['appdict'] = {}
@@ -38,6 +39,14 @@ class ConfigReader(object):
         self.argsdict['queuepolicy'] = 'fifo'
         self.argsdict['ibandwidth'] = 0
         self.argsdict['ebandwidth'] = 0
+        self.argsdict['burst'] = 0
+        self.argsdict['backlog'] = 0
+        self.argsdict['coalesce'] = 0
+        self.argsdict['transport'] = 'tcp'
+        self.argsdict['mtu'] = 0
+        self.argsdict['workers'] = 0
+        self.argsdict['engine'] = 'thread'
+        self.argsdict['shards'] = 0
         lines = self.read_config(ifn)
 
         self.vrouters = self.get_vrouters(self.argsdict['topology'])
@@ -86,6 +95,7 @@ class ConfigReader(object):
                 ibandwidth = self.argsdict['ibandwidth']
                 ebandwidth = self.argsdict['ebandwidth']
                 ihandler = self.argsdict['ihandler']
+                shards = self.argsdict['shards']
                 upperapp = self.upperapp[vrid] if vrid in self.upperapp.keys() else None
                 if self.vrconf.has_key(vrid):
                     cachesize = self.vrconf[vrid]['cachesize']
@@ -95,11 +105,13 @@ class ConfigReader(object):
                     queuepolicy = self.vrconf[vrid]['queuepolicy']
                     ibandwidth  = self.vrconf[vrid]['ibandwidth']
                     ebandwidth  = self.vrconf[vrid]['ebandwidth']
+                    shards      = self.vrconf[vrid]['shards']
 
                 arg = {'vrid':   vrid,
                        'vrfile': self.argsdict['vrouter'],
                        'tfile': self.argsdict['topology'], 
                        'rtable': self.argsdict['rtable'],
+                       'rcache': self.argsdict['rcache'],
                        'logdir': self.argsdict['logdir'],
                        'cssz': int(cachesize),
                        'cstg': cachestg,
@@ -108,6 +120,14 @@ class ConfigReader(object):
                        'queuepolicy': queuepolicy,
                        'ibandwidth': int(ibandwidth),
                        'ebandwidth': int(ebandwidth),
+                       'burst': int(self.argsdict['burst']),
+                       'backlog': int(self.argsdict['backlog']),
+                       'coalesce': float(self.argsdict['coalesce']),
+                       'transport': self.argsdict['transport'],
+                       'mtu': int(self.argsdict['mtu']),
+                       'workers': int(self.argsdict['workers']),
+                       'engine': self.argsdict['engine'],
+                       'shards': int(shards),
                        'ihandler': ihandler,
                        'upperapp': upperapp
                        }
@@ -150,9 +170,11 @@ class ConfigReader(object):
                 queuepolicy = self.argsdict['queuepolicy']  if m[5]=='*' else m[5]
                 ibandwidth = self.argsdict['ibandwidth']  if m[6]=='*' else m[6]
                 ebandwidth = self.argsdict['ebandwidth']  if m[7]=='*' else m[7]
+                shards = self.argsdict['shards']  if len(m) < 9 or m[8]=='*' else m[8]
                 vrconf[vrid] = {'cachesize':cachesize, 'cachestg':cachestg, 'cacherpl':cacherpl,
                                 'queuesize':queuesize, 'queuepolicy':queuepolicy,
-                                'ibandwidth':ibandwidth, 'ebandwidth':ebandwidth}
+                                'ibandwidth':ibandwidth, 'ebandwidth':ebandwidth,
+                                'shards':shards}
         return vrconf
 
     def get_upperapp(self, ifn):
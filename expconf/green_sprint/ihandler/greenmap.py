@@ -20,6 +20,7 @@ from messageheader import *
 
 TIME_SCALE = 30  # time scale factor in seconds
 TALIGNMENT = 100 # alignement for startup time.
+FLOW_ROUTES = True  # routes are set per (src, dst), see Router.enable_flow_routes
 
 class GreenMap(object):
     """GreenMap class not only reads config file, and updates routing table,
@@ -69,7 +70,7 @@ class GreenMap(object):
                 if node != self.router.vrid:
                     continue
                 if tm == 0:
-                    self.router.rtable[(src, dst)] = nexthop
+                    self.router.set_flow_route(src, dst, nexthop)
                     continue
                 m[0] = tmst + tm * TIME_SCALE
                 green_rt.append(m)
@@ -78,16 +79,20 @@ class GreenMap(object):
         return green_rt
 
     def init_rtable(self):
-        """Initialize the router rtable based on the pathdict."""
-        for k, v in self.router.pathdict.items():
-            try:
-                if self.router.vrid not in v:
-                    self.router.rtable[k] = None
-                else:
-                    ti = v.index(self.router.vrid)
-                    self.router.rtable[k] = v[ti + 1]
-            except Exception, err:
-                print "Exception:init_rtable()", err
+        """Initialize the per-flow routes based on the pathdict, a flow
+        whose path goes through me is sent to the next hop on its path.
+        The other flows follow rtable."""
+        vrid = self.router.vrid
+        routers = self.router.routers
+        for src in routers:
+            for dst in routers:
+                try:
+                    v = self.router.pathdict.get((src, dst), None)
+                    if v is not None and vrid in v[:-1]:
+                        ti = v.index(vrid)
+                        self.router.set_flow_route(src, dst, v[ti + 1])
+                except Exception, err:
+                    print "Exception:init_rtable()", err
         pass
 
     def refresh_rtable(self):
@@ -104,7 +109,7 @@ class GreenMap(object):
                 for m in list(self.green_rt):
                     tm, src, dst, node, nexthop = m
                     if tm <= tsn:
-                        self.router.rtable[(src, dst)] = nexthop
+                        self.router.set_flow_route(src, dst, nexthop)
                         self.green_rt.remove(m)
                     else:
                         break
@@ -5,12 +5,17 @@ import sys
 import time
 
 def ihandler(hdr, router):
-    nexthop = router.rtable.get((hdr.src, hdr.dst), None)
-    if nexthop is not None:
-        hdr.nxt = nexthop
+    if router.frtable is None:
+        hdr.nxt = router.rtable[hdr.dst]
     else:
-        hdr.nxt = -1
+        hdr.nxt = router.flow_next_hop(hdr.src, hdr.dst)
     return False
 
+# Only reads dst and patches nxt, src only with per-flow routes. It runs
+# for the packets to me as well, a handler before it may have readdressed
+# one, e.g. a nbsearch QUERY turned into a REQUEST, which still needs its
+# next hop.
+ihandler_lazy  = True
+
 if __name__=='__main__':
     pass
@@ -54,9 +54,9 @@ class Server(object):
                 shdr.hop = rhdr.hop + 1
                 shdr.data = self.chunks[rhdr.id]
 
-                self.router.send(shdr)
                 #print "RESPONSE -> %s" % (str(shdr.dst))
                 logme(self.logfh, shdr.seq, shdr.src, shdr.dst, "RSP", shdr.hit, shdr.id, shdr.hop)
+                self.router.send(shdr)
             except KeyboardInterrupt:
                 break
             except Exception, err:
@@ -26,6 +26,8 @@ class JobControl(object):
         self.state = ''  # state a of job: INIT|READY|RUN|PAUSE|STOP
         self.vrdict = {}  # Mapping from logical node to (ip,port)
         self.vr_process = {}
+        self.workers = []  # [argslist, process, command queue] of worker processes hosting many routers
+        self.vr_worker = {}  # Mapping from logical node to the worker hosting it
         self.vr_lock = threading.Lock()  # Protect vrdict and vr_process
         self.done = threading.Event()
         t = threading.Thread(target=self.watcher, args=())
@@ -34,7 +36,12 @@ class JobControl(object):
         pass
 
     def create_router(self, args):
-        """Create a router without running it."""
+        """Create a router without running it. If args['workers'] > 0,
+        the routers of the job share that many worker processes, and the
+        routers in a worker share its ip and port."""
+        if args.get('workers', 0) > 0:
+            return self.create_router_in_worker(args)
+
         args['ip'] = router.common.get_myip()
         args['iport'] = router.common.get_iport()
         args['l2p'] = self.vrdict
@@ -47,20 +54,63 @@ class JobControl(object):
 
         return p
 
+    def create_router_in_worker(self, args):
+        """Add a router to the worker hosting the fewest routers, start a
+        new worker if there are less than args['workers'] of them."""
+        args['l2p'] = self.vrdict
+
+        self.vr_lock.acquire()
+        if len(self.workers) < args['workers']:
+            argslist = []
+            cmdq = Queue()
+            p = Process(target=worker_wrapper, args=(argslist, cmdq))
+            worker = [argslist, p, cmdq]
+            self.workers.append(worker)
+            args['ip'] = router.common.get_myip()
+            args['iport'] = router.common.get_iport()
+        else:
+            worker = min(self.workers, key=lambda x: len(x[0]))
+            argslist, p, cmdq = worker
+            args['ip'] = argslist[0]['ip']
+            args['iport'] = argslist[0]['iport']
+        argslist.append(args)
+        self.vrdict[args['vrid']] = (args['ip'],args['iport'])
+        self.vr_process[args['vrid']] = (args,p)
+        self.vr_worker[args['vrid']] = worker
+        self.vr_lock.release()
+
+        return p
+
     def remove_router(self, vrid):
-        """Remove a router given its vrid"""
+        """Remove a router given its vrid. A router in a worker is stopped
+        by the worker, which is only terminated with its last router."""
         self.vr_lock.acquire()
         if vrid in self.vrdict.keys():
             self.vrdict.pop(vrid)
         if vrid in self.vr_process.keys():
             try:
-                _, p = self.vr_process.pop(vrid)
-                p.terminate()
+                args, p = self.vr_process.pop(vrid)
+                worker = self.vr_worker.pop(vrid, None)
+                if worker is None:
+                    p.terminate()
+                else:
+                    self.remove_from_worker(worker, args)
             except Exception, err:
                 print "Exception:JobControl.remove_router():", err
         self.vr_lock.release()
         pass
 
+    def remove_from_worker(self, worker, args):
+        """Take a router off its worker, the caller holds vr_lock."""
+        argslist, p, cmdq = worker
+        argslist[:] = [ x for x in argslist if x is not args ]
+        if len(argslist) == 0:
+            self.workers = [ x for x in self.workers if x is not worker ]
+            p.terminate()
+        elif p.is_alive():
+            cmdq.put(('remove', args['vrid']))
+        pass
+
     def __del__(self):
         self.terminate()
         pass
@@ -100,7 +150,7 @@ class JobControl(object):
         self.vr_lock.acquire()
         for vrid, v in self.vr_process.items():
             args, p = v
-            if not p.is_alive():
+            if not p.is_alive() and p.exitcode is None:
                 p.start()
         self.vr_lock.release()
         pass
@@ -110,9 +160,12 @@ class JobControl(object):
         self.vr_lock.acquire()
         for k in self.vr_process.keys():
             _, p = self.vr_process.pop(k)
-            p.terminate()
+            if p.is_alive():
+                p.terminate()
             # Liang: temp banned, it seems I cannot start following processes if I use this. Can not figure out the reason at the moment.
             # os.waitpid(p.pid, 0)
+        self.workers = []
+        self.vr_worker = {}
         self.vr_lock.release()        
         self.done.set()
         pass
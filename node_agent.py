@@ -8,6 +8,7 @@
 import bisect
 import os
 import random
+import shutil
 import socket
 import subprocess
 import sys
@@ -18,6 +19,8 @@ from config_reader import ConfigReader
 from job_control import JobControl
 from job_mgmt import JobMgmt
 from node_stat import NodeStat
+from router.routing import compute_rtable_file
+from router.rcache import RoutingCache
 
 BPORT = 2011
 PACKAGE_LEN = 64*2**10
@@ -185,6 +188,18 @@ class Agent(threading.Thread):
         l = l[:5]
         self.jmgmt.add_job(jobid, ifn, l)
 
+        # Compute the symmetric routing once for the whole job, each router
+        # then maps its own row from the file instead of recomputing it.
+        if config.argsdict['rtable'] == 'sym':
+            rtfile = '%s/rtable-%i' % (config.argsdict['logdir'], jobid)
+            self.prepare_rtable_file(config, rtfile)
+            for vrd in config.vrdetail.values():
+                vrd['rtable'] = rtfile
+
+        # Trim the routing cache once per job, the routers only add to it.
+        if config.argsdict['rcache']:
+            RoutingCache(config.argsdict['rcache']).evict()
+
         for x in l:
             agcpu, agip = x
             # Liang: debug, needs improvement
@@ -200,6 +215,26 @@ class Agent(threading.Thread):
             m += 1
         pass
 
+    def prepare_rtable_file(self, config, rtfile):
+        """Compute the routing file of a job, or take it from the routing
+        cache if the same topology has been routed before."""
+        tfile = config.argsdict['topology']
+        if not config.argsdict['rcache']:
+            compute_rtable_file(tfile, rtfile)
+            return
+        rcache = RoutingCache(config.argsdict['rcache'])
+        rkey = rcache.key(tfile, 'sym')
+        fn = rcache.get(rkey, 'pathstore')
+        if fn is None:
+            fn = rcache.path(rkey, 'pathstore')
+            compute_rtable_file(tfile, fn)
+        # The job keeps its own link, the cached one may be evicted.
+        try:
+            os.link(fn, rtfile)
+        except OSError:
+            shutil.copyfile(fn, rtfile)
+        pass
+
     def process_jobc(self, msg):
         """Set the router set in corresponding JobControl object"""
         jobid = msg['jobid']
@@ -19,6 +19,10 @@ from cache_lru import cache_lru
 
 
 class green_cachedbit(object):
+    # Only requests and responses are cached, the other packets pass by
+    ihandler_lazy  = True
+    ihandler_types = (MessageType.REQUEST, MessageType.RESPONSE)
+
     def __init__(self, router, cachesize):
         self.router = router             # Cache's corresponding router
         self.cache = cache_lru(cachesize)
@@ -24,8 +24,17 @@ from cache_lru import cache_lru
 TIME_SCALE = 30  # time scale factor in seconds
 
 class green_nbscg(object):
+    # Requests and responses are cached, queries and the bloom filters of
+    # the neighbours serve the search, the other packets pass by
+    ihandler_lazy  = True
+    ihandler_types = (MessageType.REQUEST, MessageType.RESPONSE,
+                      MessageType.QUERY, MessageType.BFBDST)
+    # The bloom filter of the cache is sent by a thread of the router
+    # process, which shards could not keep up to date
+    ihandler_shardable = False
+
     def __init__(self, router, cachesize):
-        router.greenmap = router.manager.dict()
+        router.greenmap = {}             # node -> {time: green ratio}
         self.router = router
         self.router.build_routing_table(self.router.vrid)
         self.cache = cache_lru(cachesize)
@@ -100,7 +109,7 @@ class green_nbscg(object):
         if hdr.ttl > 0:
             for nb, bf in self.nbbf.items():
                 if hdr.id in bf:
-                    gr = self.router.greenmap[nb].get(tmst, 0)
+                    gr = self.router.greenmap.get(nb, {}).get(tmst, 0)
                     nbs.append((gr, nb))
         if len(nbs) > 0:
             found = True
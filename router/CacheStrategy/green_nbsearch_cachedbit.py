@@ -20,6 +20,15 @@ from pybloom import BloomFilter
 from cache_lru import cache_lru
 
 class green_nbsearch_cachedbit(object):
+    # Requests and responses are cached, queries and the bloom filters of
+    # the neighbours serve the search, the other packets pass by
+    ihandler_lazy  = True
+    ihandler_types = (MessageType.REQUEST, MessageType.RESPONSE,
+                      MessageType.QUERY, MessageType.BFBDST)
+    # The bloom filter of the cache is sent by a thread of the router
+    # process, which shards could not keep up to date
+    ihandler_shardable = False
+
     def __init__(self, router, cachesize):
         self.router = router
         self.router.build_routing_table(self.router.vrid)
@@ -19,8 +19,10 @@ import hashlib
 import binascii
 import pickle
 from ctypes import *
+from multiprocessing.sharedctypes import RawArray
 
 from messageheader import *
+from routing import PathStore, is_rtable_file
 
 # Some global varialbes
 RETRYNUM    = 3
@@ -324,8 +326,19 @@ def get_responsible_router(manifest, pathid, header_hash):
             break
     return router
 
+def create_rtable(size):
+    """Create a dense routing table in shared memory. The table is indexed
+    by destination vrid and holds the next hop, -1 means no route. It must be
+    created before forking, then upperapps see the same table."""
+    rtable = RawArray(c_int32, size)
+    memset(rtable, 0xff, sizeof(rtable))
+    return rtable
+
 def load_pathdict(ifn):
-    """Load router's pathdict from a specified file"""
+    """Load router's pathdict from a specified file, either a saved
+    PathStore which is mmap-ed, or a pickled dict."""
+    if is_rtable_file(ifn):
+        return PathStore.load(ifn)
     pathdict = pickle.Unpickler(open(ifn, "r")).load()
     return pathdict
 
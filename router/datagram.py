@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+#
+# This script defines DatagramPort, the UDP transport of the links. The
+# links still open over a TCP channel, but their packets travel in
+# datagrams, so the loss and delay of the emulated links are not
+# distorted by the retransmission and head-of-line blocking of TCP. A
+# packet bigger than the MTU is cut into segments and is lost if any
+# of them is lost. With the reactor engine the port has no threads of
+# its own, the reactor reads the socket and runs the writes.
+#
+# Liang Wang @ Dept. Computer Science, University of Helsinki, Finland
+# 2026.10.18 created.
+#
+
+import os
+import sys
+import time
+import errno
+import socket
+import struct
+import threading
+
+from Queue import Empty
+from fastqueue import FastQueue
+from framing import LINK_HDR
+from messageheader import *
+
+UDP_MTU   = 1472         # default max datagram payload
+UDP_BATCH = 256          # max number of packets sent or received at once
+UDP_REASM = 1.0          # seconds to wait for the missing segments of a packet
+UDP_SOBUF = 4*2**20      # socket buffer size
+SEG_HDR   = struct.Struct('!IHH')    # packet id, segment index, segment count
+
+class DatagramPort(object):
+    """One UDP socket per process. A datagram carries the tag of its
+    link, the segment header and a segment of the packet. Python 2 has
+    no sendmmsg/recvmmsg, so the sender drains its queue and writes the
+    datagrams back to back, and the receiver reads with MSG_DONTWAIT
+    after the first datagram until the socket is empty, then hands the
+    packets to their links in batches."""
+
+    def __init__(self, port, transport, mtu=0):
+        self.port = port
+        self.transport = transport
+        self.mtu = mtu if mtu > 0 else UDP_MTU
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, UDP_SOBUF)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, UDP_SOBUF)
+        self.sock.bind( ('', port) )
+        self.equeue = FastQueue(15000)
+        self.pid = 0                       # id of the next packet sent
+        self.partial = {}                  # (src, dst, pid) -> [time, missing, segments]
+        self.purged = time.time()
+        self.buf = bytearray(65536)        # receive buffer, only one reader uses it
+        self.view = memoryview(self.buf)
+        self.reactor = None
+        self.writing = False
+        self.lock = threading.Lock()
+        pass
+
+    def start(self, reactor=None):
+        """Start the reader and writer threads, or hand the socket to the
+        reactor if there is one."""
+        if reactor is not None:
+            self.reactor = reactor
+            self.sock.setblocking(0)
+            reactor.register(self.sock.fileno(), self.on_readable)
+            return
+
+        t0 = threading.Thread(target=self.ingress)
+        t0.daemon = True
+        t0.start()
+
+        t1 = threading.Thread(target=self.egress)
+        t1.daemon = True
+        t1.start()
+        pass
+
+    def send(self, addr, tag, msg_hdr):
+        self.enqueue([ (addr, tag, msg_hdr) ])
+        pass
+
+    def send_many(self, addr, tag, hdrs):
+        self.enqueue([ (addr, tag, x) for x in hdrs ])
+        pass
+
+    def enqueue(self, items):
+        """Queue the packets for the writer. With a reactor, the first
+        packet schedules a write, the loop thread queues without
+        blocking, the write empties the queue in the same round."""
+        if self.reactor is None:
+            self.equeue.put_many(items, True)
+            return
+        if self.reactor.in_loop():
+            self.equeue.extend(items)
+        else:
+            self.equeue.put_many(items, True)
+        self.lock.acquire()
+        if self.writing:
+            self.lock.release()
+            return
+        self.writing = True
+        self.lock.release()
+        self.reactor.call_soon(self.on_writable)
+        pass
+
+    def egress(self):
+        """Cut the packets into datagrams and send them."""
+        while True:
+            try:
+                self.write(self.equeue.get_many(UDP_BATCH, True))
+            except Exception, err:
+                print "Exception:DatagramPort.egress():", err
+        pass
+
+    def on_writable(self):
+        """Write the queued packets, called by the reactor. A datagram
+        the socket has no room for is lost, as on a full link."""
+        while True:
+            try:
+                items = self.equeue.get_many(UDP_BATCH, False)
+            except Empty:
+                self.lock.acquire()
+                if self.equeue.empty():
+                    self.writing = False
+                    self.lock.release()
+                    return
+                self.lock.release()
+                continue
+            try:
+                self.write(items)
+            except Exception, err:
+                print "Exception:DatagramPort.on_writable():", err
+        pass
+
+    def write(self, items):
+        """Send a batch of packets, each in one or more datagrams."""
+        sendto = self.sock.sendto
+        for addr, tag, msg_hdr in items:
+            data = msg_hdr.send()
+            seg = self.mtu - len(tag) - SEG_HDR.size
+            count = (len(data) + seg - 1) // seg
+            self.pid = (self.pid + 1) & 0xffffffff
+            for i in range(count):
+                try:
+                    sendto(''.join([ tag, SEG_HDR.pack(self.pid, i, count),
+                                     data[i * seg : (i + 1) * seg] ]), addr)
+                except socket.error, err:
+                    if err.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                        raise
+        pass
+
+    def ingress(self):
+        """Receive datagrams, reassemble the packets."""
+        while True:
+            try:
+                self.receive(0)
+            except Exception, err:
+                print "Exception:DatagramPort.ingress():", err
+        pass
+
+    def on_readable(self):
+        """Read all the datagrams waiting, called by the reactor."""
+        try:
+            self.receive(socket.MSG_DONTWAIT)
+        except Exception, err:
+            print "Exception:DatagramPort.on_readable():", err
+        pass
+
+    def receive(self, flags):
+        """Receive up to UDP_BATCH datagrams, only the first read may
+        block, and hand the packets to their links in batches."""
+        view = self.view
+        buf = self.buf
+        links = self.transport.links
+        tlen = LINK_HDR.size + SEG_HDR.size
+        batch = {}
+        for i in range(UDP_BATCH):
+            try:
+                n = self.sock.recv_into(view, 0, flags)
+            except socket.error, err:
+                if err.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+            flags = socket.MSG_DONTWAIT
+            src, dst, kind = LINK_HDR.unpack_from(buf)
+            pid, idx, count = SEG_HDR.unpack_from(buf, LINK_HDR.size)
+            link = links.get((src, dst), None)
+            if link is None:
+                continue
+            if count == 1:
+                data = view[tlen:n]
+            else:
+                data = self.reassemble((src, dst, pid), idx, count, view[tlen:n].tobytes())
+                if data is None:
+                    continue
+            msg_hdr = blank_header()
+            if link.lazy:
+                msg_hdr.wrap(data)
+            else:
+                msg_hdr.recv(data)
+            batch.setdefault(link, []).append(msg_hdr)
+
+        for link, hdrs in batch.items():
+            link.on_packets(hdrs)
+
+        if self.partial and time.time() - self.purged > UDP_REASM:
+            self.purged = self.purge()
+        pass
+
+    def reassemble(self, key, idx, count, seg):
+        """Keep a segment, return the packet once all segments are here."""
+        entry = self.partial.get(key, None)
+        if entry is None:
+            entry = self.partial[key] = [time.time(), count, [None] * count]
+        segs = entry[2]
+        if idx >= len(segs) or segs[idx] is not None:
+            return None
+        segs[idx] = seg
+        entry[1] -= 1
+        if entry[1]:
+            return None
+        del self.partial[key]
+        return ''.join(segs)
+
+    def purge(self):
+        """Drop the packets that still miss segments after UDP_REASM."""
+        now = time.time()
+        for key, entry in self.partial.items():
+            if now - entry[0] > UDP_REASM:
+                del self.partial[key]
+        return now
+
+    pass
+
+
+if __name__=="__main__":
+    sys.exit(0)
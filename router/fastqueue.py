@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+#
+# This script defines FastQueue, the queue used on the data path of a
+# router. Producer and consumer are threads in the same process, so there
+# is no need to pickle the packets and push them through a pipe as
+# multiprocessing.Queue does.
+#
+# Liang Wang @ Dept. Computer Science, University of Helsinki, Finland
+# 2026.10.18 created.
+#
+
+import os
+import sys
+import time
+import threading
+from collections import deque
+from Queue import Empty, Full
+
+class FastQueue(object):
+    """Bounded FIFO queue for threads in the same process, a deque guarded
+    by two conditions. Besides the put/get interface of Queue, it offers
+    put_many/get_many to move a batch of items with one lock round trip.
+    maxsize <= 0 means unbounded."""
+
+    def __init__(self, maxsize=0):
+        self.maxsize = maxsize
+        self.queue = deque()
+        self.mutex = threading.Lock()
+        self.not_empty = threading.Condition(self.mutex)
+        self.not_full = threading.Condition(self.mutex)
+        self.waiters = {self.not_empty: 0, self.not_full: 0}
+        pass
+
+    def qsize(self):
+        return len(self.queue)
+
+    def empty(self):
+        return not self.queue
+
+    def full(self):
+        return 0 < self.maxsize <= len(self.queue)
+
+    def _wait(self, cond, pred, block, timeout):
+        """Wait on cond while pred() holds, return False on timeout. The
+        number of waiters is kept, so that put/get only notify when some
+        thread is actually waiting."""
+        if not pred():
+            return True
+        if not block:
+            return False
+        deadline = time.time() + timeout if timeout is not None else None
+        self.waiters[cond] += 1
+        try:
+            while pred():
+                if deadline is None:
+                    cond.wait()
+                    continue
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                cond.wait(remaining)
+        finally:
+            self.waiters[cond] -= 1
+        return True
+
+    def _notify(self, cond, n=1):
+        if self.waiters[cond]:
+            cond.notify(n)
+        pass
+
+    def put(self, item, block=True, timeout=None):
+        with self.mutex:
+            if not self._wait(self.not_full, self.full, block, timeout):
+                raise Full
+            self.queue.append(item)
+            self._notify(self.not_empty)
+        pass
+
+    def put_nowait(self, item):
+        return self.put(item, False)
+
+    def put_many(self, items, block=True, timeout=None):
+        """Put all the items in order, blocking while the queue is full."""
+        i = 0
+        n = len(items)
+        with self.mutex:
+            while i < n:
+                if not self._wait(self.not_full, self.full, block, timeout):
+                    raise Full
+                room = self.maxsize - len(self.queue) if self.maxsize > 0 else n - i
+                self.queue.extend(items[i:i + room])
+                i += room
+                self._notify(self.not_empty, room)
+        pass
+
+    def put_some(self, items):
+        """Put the items in order as long as there is room, never block.
+        Return the number of items put, the caller drops the others."""
+        with self.mutex:
+            n = len(items)
+            if self.maxsize > 0:
+                n = min(n, self.maxsize - len(self.queue))
+            if n <= 0:
+                return 0
+            self.queue.extend(items[:n] if n < len(items) else items)
+            self._notify(self.not_empty, n)
+        return n
+
+    def extend(self, items):
+        """Put all the items at once, even beyond maxsize. It is for a
+        consumer that must never block, e.g. the reactor, which bounds
+        the queue by other means."""
+        with self.mutex:
+            self.queue.extend(items)
+            self._notify(self.not_empty, len(items))
+        pass
+
+    def get(self, block=True, timeout=None):
+        with self.mutex:
+            if not self._wait(self.not_empty, self.empty, block, timeout):
+                raise Empty
+            item = self.queue.popleft()
+            self._notify(self.not_full)
+            return item
+
+    def get_nowait(self):
+        return self.get(False)
+
+    def get_many(self, maxn, block=True, timeout=None):
+        """Get at least one and at most maxn items, as a list."""
+        with self.mutex:
+            if not self._wait(self.not_empty, self.empty, block, timeout):
+                raise Empty
+            q = self.queue
+            n = min(maxn, len(q))
+            items = [ q.popleft() for i in range(n) ]
+            self._notify(self.not_full, n)
+            return items
+
+    pass
+
+
+if __name__=="__main__":
+    sys.exit(0)
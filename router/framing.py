@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+#
+# This script defines FrameReader and FrameWriter, the two sides of the
+# framing used on the links. A frame is a 4-byte length in network order
+# followed by the packet. The reader receives into a preallocated
+# bytearray with recv_into and hands out frames as memoryviews into it,
+# so nothing is copied between the socket and MessageHeader.wrap. The
+# writer joins a batch of frames into one str and sends it in one call.
+# Python 2 sockets have no sendmsg and there is no os.writev either, so
+# the join is the one copy of a payload on its way out.
+#
+# Liang Wang @ Dept. Computer Science, University of Helsinki, Finland
+# 2026.10.18 created.
+#
+
+import os
+import sys
+import struct
+
+RING_LEN  = 512*2**10    # initial receive buffer, grows for bigger frames
+WRITE_LEN = 256*2**10    # max bytes handed to the kernel in one write
+FRAME_HDR = struct.Struct('!I')
+
+# Frames and datagrams of the links start with the tag of the link
+LINK_HDR  = struct.Struct('!iiB')    # (from, to) vrids of a virtual link, frame kind
+LINK_DATA = 0                        # a packet
+LINK_OPEN = 1                        # open the link, the body carries its options
+LINK_BELL = 2                        # doorbell, packets are waiting in the ring of the link
+LINK_CLOSE = 3                       # close the link, the other end is removed
+LINK_HELLO = 4                       # first frame of a connection, the body is ip:port the opener serves on
+LINK_ROOM = 5                        # the ring of the link has room again for a waiting producer
+
+class FrameReader(object):
+    """Read length-prefixed frames from a stream socket. The unparsed
+    bytes are buf[head:tail], they are moved to the front only when a
+    frame does not fit in the rest of the buffer."""
+
+    def __init__(self, conn, size=RING_LEN):
+        self.conn = conn
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+        self.head = 0
+        self.tail = 0
+        pass
+
+    def compact(self, need):
+        """Make room for need bytes from head, move the partial frame to
+        the front, grow the buffer if the frame is bigger than it."""
+        n = self.tail - self.head
+        if need > len(self.buf):
+            buf = bytearray(max(need, 2 * len(self.buf)))
+            buf[:n] = self.view[self.head:self.tail]
+            self.buf = buf
+            self.view = memoryview(buf)
+        elif n:
+            self.buf[:n] = self.view[self.head:self.tail].tobytes()
+        self.head = 0
+        self.tail = n
+        pass
+
+    def fill(self, need):
+        """Receive until need bytes are available, False on EOF."""
+        if self.head == self.tail:
+            self.head = self.tail = 0
+        if self.head + need > len(self.buf):
+            self.compact(need)
+        while self.tail - self.head < need:
+            n = self.conn.recv_into(self.view[self.tail:])
+            if n == 0:
+                return False
+            self.tail += n
+        return True
+
+    def read(self):
+        """Return the next frame as a memoryview, it is only valid until
+        the next call. Return None when the peer closes the connection."""
+        if not self.fill(FRAME_HDR.size):
+            return None
+        length = FRAME_HDR.unpack_from(self.buf, self.head)[0]
+        if not self.fill(FRAME_HDR.size + length):
+            return None
+        start = self.head + FRAME_HDR.size
+        self.head = start + length
+        return self.view[start:self.head]
+
+    def receive(self):
+        """Receive what a non-blocking socket has, at most the room left
+        in the buffer, which is made big enough for the pending frame.
+        Return False on EOF, socket.error is raised if nothing is there."""
+        if self.head == self.tail:
+            self.head = self.tail = 0
+        need = FRAME_HDR.size
+        if self.tail - self.head >= need:
+            need += FRAME_HDR.unpack_from(self.buf, self.head)[0]
+        if self.tail == len(self.buf) or self.head + need > len(self.buf):
+            self.compact(need)
+        n = self.conn.recv_into(self.view[self.tail:])
+        if n == 0:
+            return False
+        self.tail += n
+        return True
+
+    def pending(self):
+        """Return the next frame already in the buffer as read() does,
+        None if it is not complete yet. The socket is not touched."""
+        n = self.tail - self.head
+        if n < FRAME_HDR.size:
+            return None
+        length = FRAME_HDR.unpack_from(self.buf, self.head)[0]
+        if n < FRAME_HDR.size + length:
+            return None
+        start = self.head + FRAME_HDR.size
+        self.head = start + length
+        return self.view[start:self.head]
+
+    pass
+
+
+class FrameWriter(object):
+    """Write batches of packets to a stream socket. The pieces of all
+    the frames (length, header, payload) are joined and go out in one
+    sendall, or in one send on a non-blocking socket. A tagged writer
+    takes (tag, packet) pairs and puts the tag in front of the packet,
+    the packet may also be a str, which is sent as it is."""
+
+    def __init__(self, conn, tagged=False):
+        self.conn = conn
+        self.tagged = tagged
+        pass
+
+    def write(self, items):
+        """Send the packets in items, in writes of about WRITE_LEN bytes."""
+        for pieces in self.batches(items):
+            self.flush(pieces)
+        pass
+
+    def batches(self, items):
+        """Turn the packets in items into lists of pieces of about
+        WRITE_LEN bytes."""
+        pieces = []
+        size = 0
+        tag = ''
+        for hdr in items:
+            if self.tagged:
+                tag, hdr = hdr
+            if isinstance(hdr, str):
+                pieces.append(FRAME_HDR.pack(len(tag) + len(hdr)))
+                pieces.append(tag)
+                pieces.append(hdr)
+                size += FRAME_HDR.size + len(tag) + len(hdr)
+                continue
+            head = hdr.pack()
+            n = len(tag) + len(head) + len(hdr.data)
+            pieces.append(FRAME_HDR.pack(n))
+            pieces.append(tag)
+            pieces.append(head)
+            pieces.append(hdr.data)
+            size += FRAME_HDR.size + n
+            if size >= WRITE_LEN:
+                yield pieces
+                pieces = []
+                size = 0
+        if pieces:
+            yield pieces
+        pass
+
+    def flush(self, pieces):
+        """Write all the pieces to the socket."""
+        self.conn.sendall(''.join(pieces))
+        pass
+
+    def send(self, pieces):
+        """Write as much of the pieces as a non-blocking socket takes in
+        one call, return the pieces left, a memoryview of the rest of
+        the joined pieces if the socket took only part of them."""
+        data = pieces[0] if len(pieces) == 1 else ''.join(pieces)
+        n = self.conn.send(data)
+        if n < len(data):
+            return [ memoryview(data)[n:] ]
+        return []
+
+    pass
+
+
+if __name__=="__main__":
+    sys.exit(0)
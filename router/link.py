@@ -2,8 +2,10 @@
 # 
 # This script defines the Link class. Link class is an abstraction of
 # a physical link. All the link properties, such as link weight,
-# bandwidth, delay and loss rate are modelled in this class. Link
-# class also maintains the connectivity of two SRouters.
+# bandwidth, delay and loss rate are modelled in this class. The
+# packets of a link travel on a Channel, which it shares with all the
+# other links towards the same remote endpoint, or on a pair of
+# shared-memory rings if both ends are on the same node.
 #
 # Liang Wang @ Dept. Computer Science, University of Helsinki, Finland
 # 2012.03.18 created.
@@ -16,10 +18,19 @@ import random
 import socket
 import struct
 import threading
-from multiprocessing import Queue
 
 from common import *
+from shmring import ShmRing, ring_size
+from scheduler import get_scheduler
+from reactor import LOOP_WAIT
+from framing import LINK_BELL, LINK_ROOM
 from messageheader import *
+from collections import deque
+
+RING_TIME    = 0.1       # seconds of traffic at full rate a ring holds for an unbounded backlog
+RING_BATCH   = 256       # max number of packets taken from a ring at once
+LINK_HOLD    = 4096      # packets a link holds before the queue feeding it stalls, see hold()
+RING_WAIT    = 1.0       # max time to wait for room in the tx ring before checking closed
 
 class Link(object):
     """Link class is an abstraction of a physical link. All the link
@@ -29,99 +40,272 @@ class Link(object):
     le0, pe0 means logical and physical id of myelf; pe0: <ip, port>;
     le1, pe1 means logical and physical id of the other end."""
 
-    def __init__(self, p, q):
+    def __init__(self, p, q, backlog=0):
         """Init a link based on input parameters. p is a dictionary
         contains following properties: weight: min val is 1;
-        bandwidth: in bytes; delay: in seconds; lossrate: [0.0, 1.0]"""
+        bandwidth: in bytes; delay: in seconds; lossrate: [0.0, 1.0].
+        backlog is the serialization backlog in bytes the link buffers,
+        like the output queue of a real link, the packets beyond it are
+        dropped. Zero means unbounded, packets only wait longer."""
         self.weight = p['weight']
         self.bandwidth = p['bandwidth']
         self.delay = p['delay']
         self.lossrate = p['lossrate']
         self.vr_iqueue = q
-        self.iqueue = Queue(15000)
-        self.equeue = Queue(15000)
+        self.channel = None
+        self.tag = None
+        self.ends = None                   # (from, to) vrids of the link
+        self.tx = None                     # shared-memory rings to and from a co-located neighbour
+        self.rx = None
+        self.room = threading.Event()      # set when the other end has popped from a full tx ring
+        self.dgram = None                  # datagram port and remote address, for the udp transport
+        self.daddr = None
+        self.pending = deque()             # packets held while the output is congested, reactor only
+        self.source = None                 # LoopQueue feeding the link, reactor only
+        self.lazy = False                  # received headers are LazyHeaders, see Router.register_ihandler
+        self.closed = False                # either end is removed, packets sent are dropped
+        self.drops = 0                     # packets from the other end dropped by the backlog or a full router queue
+
+        # Packets in flight are kept by the timing wheel of the process
+        self.busy = 0.0                    # time the link finishes serializing
+        self.backlog = float(backlog) / self.bandwidth if backlog > 0 else None
+        self.timed = self.delay > 0 or self.bandwidth != float('inf')
+        self.wheel = get_scheduler() if self.timed else None
+        pass
+
+    def bind(self, channel, src, dst):
+        """The channel is set up, link starts functioning."""
+        self.channel = channel
+        self.tag = channel.tag(src, dst)
+        self.ends = (src, dst)
         pass
 
-    def setup(self, conn):
-        """TCP connection already setup, link starts functioning"""
-        t0 = threading.Thread(target=self.ingress, args=(conn,))
-        t0.daemon = True
-        t0.start()
+    def create_rings(self):
+        """Create the rings to a co-located neighbour, return their names
+        as link options for the other end. The rings hold about as many
+        bytes as the serialization backlog of the link, RING_TIME of
+        traffic if it is unbounded."""
+        size = ring_size(self.bandwidth, self.backlog or RING_TIME)
+        self.tx = ShmRing.create('%i-%i' % self.ends, size)
+        self.rx = ShmRing.create('%i-%i' % self.ends[::-1], size)
+        return {'tx':self.tx.path, 'rx':self.rx.path}
 
-        t1 = threading.Thread(target=self.egress, args=(conn,))
-        t1.daemon = True
-        t1.start()
+    def attach_rings(self, opts):
+        """Map the rings created by the other end, its tx is my rx."""
+        self.rx = ShmRing(opts['tx'])
+        self.tx = ShmRing(opts['rx'])
+        self.rx.unlink()
+        self.tx.unlink()
         pass
 
-    def ingress(self, conn):
-        """Process incoming packets on the link. The link delay cannot
-        be less than 10ms."""
-        buf = ''
-        tc = 0
-        th = self.bandwidth / 1.0
-        t0 = time.time()
-        t1 = t0  # Time token for traffic shaping
-        t2 = t0  # Time token for modeling delay
-        delay = self.delay
-        lossrate = self.lossrate
+    def use_udp(self, port, addr):
+        """Send the packets in datagrams from port to addr."""
+        self.dgram = port
+        self.daddr = addr
+        pass
+
+    def on_frame(self, data):
+        """Process an incoming frame of the link, called by the channel."""
+        msg_hdr = blank_header()
+        if self.lazy:
+            msg_hdr.wrap(data)
+        else:
+            msg_hdr.recv(data)
+        self.on_packet(msg_hdr)
+        pass
 
+    def drain(self):
+        """Process the packets waiting in the rx ring, called by the
+        channel on a doorbell. Before going back to sleep, waiting is set
+        and the ring is checked once more, so no packet is left behind.
+        While the router queue is paused, the packets stay in the ring. A
+        producer waiting for room is told once the ring is drained."""
+        rx = self.rx
+        reactor = self.channel.reactor
         while True:
-            try:
-                # Liang: link traffic shaping
-                t1 = time.time()
-                if t1 - t0 < 1.0:
-                    if tc >= th:
-                        time.sleep(0.01)
-                        continue
-                else:
-                    t0 = t1
-                    tc = 0
-
-                length, buf = get_data(4, conn, buf)
-                length = struct.unpack('!I', length)[0]
-                data, buf = get_data(length, conn, buf)
-                msg_hdr = MessageHeader()
-                msg_hdr.recv(data)
-                tc += len(msg_hdr.data)
-
-                # Liang: Model link properties here.
-                if delay > 0:
-                    if time.time() - t2 > delay:
-                        time.sleep(delay)
-                    t2 = time.time()
-
-                if lossrate > 0:
-                    if random.random() < lossrate:
-                        #self.logfh.write("loss\n")
-                        #self.logfh.flush()
-                        continue
-
-                # Liang: Apply queueing policy here.
-                #if qp is not None and not qp(None):
-                #    continue
-
-                self.vr_iqueue.put(msg_hdr, True)
-            except Exception, err:
-                print "Exception:Link.ingress():", err
-                #self.logfh.write("EXCEPT:ingress:%s\n" % (str(err)))  # Liang: tmp use
-                if len(buf) == 0:
+            if reactor is not None and reactor.is_paused(self.vr_iqueue):
+                reactor.call_later(LOOP_WAIT, self.drain)
+                break
+            hdrs = []
+            while len(hdrs) < RING_BATCH:
+                msg_hdr = rx.pop(self.lazy)
+                if msg_hdr is None:
                     break
+                hdrs.append(msg_hdr)
+            if hdrs:
+                self.on_packets(hdrs)
+                continue
+            if rx.sleep():
+                break
+        if rx.unblock():
+            self.channel.control(self.ends[0], self.ends[1], LINK_ROOM)
+        pass
+
+    def on_packet(self, msg_hdr):
+        """Packets are scheduled for delivery by the link model in
+        schedule(). Like there, a packet the router has no room for is
+        dropped, the reader is shared by all the links of the channel."""
+        # Liang: Model link properties here.
+        if self.lossrate > 0:
+            if random.random() < self.lossrate:
+                return
 
+        # Liang: Apply queueing policy here.
+        #if qp is not None and not qp(None):
+        #    return
+
+        if self.timed:
+            self.schedule(msg_hdr)
+        elif not self.vr_iqueue.put_some([msg_hdr]):
+            self.drops += 1
         pass
 
-    def egress(self, conn):
-        """Process outgoing packets on the link."""
-        while True:
-            try:
-                msg_hdr = self.equeue.get(True)
-                send_frame(conn, msg_hdr)
-            except Exception, err:
-                print "Exception:Link.egress():", err
+    def on_packets(self, hdrs):
+        """Batch version of on_packet."""
+        if self.timed or self.lossrate > 0:
+            for msg_hdr in hdrs:
+                self.on_packet(msg_hdr)
+        else:
+            self.drops += len(hdrs) - self.vr_iqueue.put_some(hdrs)
+        pass
+
+    def schedule(self, msg_hdr):
+        """Put a packet in flight. It starts serializing once the packets
+        ahead of it are on the wire, takes bytes/bandwidth to serialize,
+        then arrives after the propagation delay. Pipelined packets
+        overlap in flight. If the backlog is bounded, a packet that finds
+        it full is dropped; blocking instead would stall every link on
+        the same channel."""
+        now = time.time()
+        busy = max(now, self.busy) + len(msg_hdr.data) / float(self.bandwidth)
+        if self.backlog is not None and busy - now > self.backlog:
+            self.drops += 1
+            return
+        self.busy = busy
+        self.wheel.schedule(busy + self.delay, self.vr_iqueue, msg_hdr)
         pass
 
     def send(self, msg_hdr):
         """Put a packet into egress queue, interface to SRouter."""
-        self.equeue.put(msg_hdr, True)
+        self.send_many([msg_hdr])
+        pass
+
+    def send_many(self, hdrs):
+        """Put a batch of packets into egress queue. The loop thread of
+        the reactor must not wait, while the output of the link is
+        congested the packets are held, see hold()."""
+        if self.closed:
+            return
+        reactor = self.channel.reactor
+        if reactor is not None and reactor.in_loop() and (self.pending or self.congested()):
+            self.hold(hdrs)
+            return
+        if self.dgram is not None:
+            self.dgram.send_many(self.daddr, self.tag, hdrs)
+            return
+        if self.tx is None:
+            self.channel.send_many(self.tag, hdrs)
+            return
+        for i in range(len(hdrs)):
+            msg_hdr = hdrs[i]
+            if not self.tx.fits(msg_hdr):
+                self.channel.send(self.tag, msg_hdr)
+            elif not self.push(msg_hdr):
+                if self.closed:
+                    return
+                self.hold(hdrs[i:])
+                break
+        self.ring_bell()
+        pass
+
+    def push(self, msg_hdr):
+        """Put a packet into the tx ring, wait while the ring is full until
+        the other end tells it has popped, see on_room(). The doorbell is
+        rung if the consumer sleeps. The reactor must not wait, the loop
+        of this process may be the consumer of the other ring of the
+        link, so there it returns False at once."""
+        tx = self.tx
+        reactor = self.channel.reactor
+        if reactor is not None and reactor.in_loop():
+            return tx.push(msg_hdr)
+        while not tx.push(msg_hdr):
+            if self.closed:
+                return False
+            self.ring_bell()
+            self.room.clear()
+            if tx.block():
+                self.room.wait(RING_WAIT)
+        return True
+
+    def on_room(self):
+        """The other end has popped from the full tx ring."""
+        self.room.set()
+        pass
+
+    def congested(self):
+        """Whether the channel carrying the packets of the link is over its
+        high-water mark, the rings and the datagrams never are."""
+        return (self.tx is None and self.dgram is None and
+                self.channel.reactor.is_congested(self.channel))
+
+    def hold(self, hdrs):
+        """Keep the packets the output of the link has no room for, in
+        the loop thread, the other links go on. Once LINK_HOLD packets
+        are held, the queue feeding the link stalls until half of them
+        are sent, see LoopQueue.stall. Without a reactor, or once the
+        link is closed, the packets are dropped."""
+        reactor = self.channel.reactor
+        if self.closed or reactor is None:
+            return
+        if not self.pending:
+            reactor.call_later(LOOP_WAIT, self.retry)
+        self.pending.extend(hdrs)
+        if len(self.pending) >= LINK_HOLD and self.source is not None:
+            self.source.stall(self, True)
+        pass
+
+    def retry(self):
+        """Send the held packets as long as the output has room, called
+        by the reactor."""
+        if self.closed:
+            return
+        pending = self.pending
+        if self.tx is not None:
+            while pending:
+                msg_hdr = pending[0]
+                if not self.tx.fits(msg_hdr):
+                    self.channel.send(self.tag, msg_hdr)
+                elif not self.tx.push(msg_hdr):
+                    break
+                pending.popleft()
+            self.ring_bell()
+        elif not self.congested():
+            hdrs = list(pending)
+            pending.clear()
+            self.channel.send_many(self.tag, hdrs)
+        if len(pending) < LINK_HOLD // 2 and self.source is not None:
+            self.source.stall(self, False)
+        if pending:
+            self.channel.reactor.call_later(LOOP_WAIT, self.retry)
+        pass
+
+    def ring_bell(self):
+        if self.tx.wake():
+            self.channel.control(self.ends[0], self.ends[1], LINK_BELL)
+        pass
+
+    def close(self):
+        """Stop the link, see Transport.close_link. The packets waiting
+        for the tx ring are dropped and the rings are released."""
+        self.closed = True
+        self.pending.clear()
+        self.room.set()
+        if self.source is not None:
+            self.source.stall(self, False)
+        for ring in (self.tx, self.rx):
+            if ring is not None:
+                ring.close()
+        self.tx = self.rx = None
         pass
 
     pass
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 # 
-# This file defines the message header used by VRouter
+# This file defines the message header used by VRouter and LazyHeader,
+# the form of a received header kept in its wire format.
 #
 # Liang Wang @ Dept. Computer Science, University of Helsinki, Finland
 # 2011.12.02 created.
@@ -9,7 +10,6 @@
 import os
 import sys
 import struct
-from ctypes import *
 
 # Some global varialbes
 DIGEST_LEN  = 20
@@ -25,82 +25,222 @@ class MessageType():
     ANSWER   = 7
     pass
 
-class MessageHeader(Structure):
-    """This class defines the message header."""
-
-    _fields_ = [ ("type",     c_uint),
-                 ("_id",      c_ubyte * DIGEST_LEN),
-                 ("seq",      c_uint),
-                 ("control",  c_ubyte),
-                 # ("neighbor", c_ubyte),
-                 # ("_visited", c_ubyte * DIGEST_LEN),
-                 ("_crid",    c_ubyte * DIGEST_LEN),
-                 ("src",      c_int32),
-                 ("dst",      c_int32),
-                 ("nxt",      c_int32),   # next hop, -1 means unset
-                 ("ttl",      c_ushort),
-                 ("hit",      c_ushort),  # test purpose
-                 ("hop",      c_ushort) ]
+# Wire format of the header, version 2. A fixed prefix holds the fields
+# a forwarding hop reads or changes: version << 4 | flags, header
+# length, type, control, ttl, hop, dst, nxt and src. It is followed by
+# the fields named in flags, each only if it is set: seq and hit when
+# they are not 0, id when it is not all zeros, crid while the cached bit
+# is set, it means nothing otherwise. LAYOUTS holds the struct of the
+# whole header for each flags value. control is 8 bits, ttl, hop and hit
+# are 16 bits, seq is 32 bits, bigger or negative values wrap around as
+# in the ctypes fields of the old header.
+WIRE_VERSION = 2
+PREFIX      = struct.Struct('!BBBBHHiii')
+HEAD        = struct.Struct('!BB')                        # version << 4 | flags, header length
+F_SEQ       = 0x1
+F_HIT       = 0x2
+F_ID        = 0x4
+F_CRID      = 0x8
+CACHED_BIT  = 0x10
+NULL_ID     = '\0' * DIGEST_LEN
+
+def layout(flags):
+    """Return the format of the fields after the prefix for flags."""
+    fmt = '!'
+    if flags & F_SEQ:
+        fmt += 'I'
+    if flags & F_HIT:
+        fmt += 'H'
+    if flags & F_ID:
+        fmt += '%is' % DIGEST_LEN
+    if flags & F_CRID:
+        fmt += '%is' % DIGEST_LEN
+    return fmt
+
+BODIES      = [ struct.Struct(layout(i)) for i in range(16) ]
+LAYOUTS     = [ struct.Struct(PREFIX.format + layout(i)[1:]) for i in range(16) ]
+HEADER_MAX  = LAYOUTS[15].size
+BODY        = [ struct.Struct('%is' % i) for i in range(HEADER_MAX + 1) ]
+
+FIELDS  = frozenset(['type', 'id', 'seq', 'control', 'crid', 'src', 'dst',
+                     'nxt', 'ttl', 'hit', 'hop'])
+LAZY    = frozenset(['type', 'control', 'dst', 'nxt', 'ttl', 'hop', 'src',
+                     'data', 'raw'])     # a LazyHeader stays lazy when they are written
+
+def header_len(buf, offset=0):
+    """Return the length of the header at offset of buf, raise
+    ValueError if it is not in the version this module speaks."""
+    vf, n = HEAD.unpack_from(buf, offset)
+    if vf >> 4 != WIRE_VERSION:
+        raise ValueError('unknown header version %i' % (vf >> 4))
+    return n
+
+def blank_header():
+    """Return a header none of whose fields is set, cheaper than
+    MessageHeader() for recv(), unpack_from() or wrap() to fill in."""
+    return MessageHeader.__new__(MessageHeader)
+
+class MessageHeader(object):
+    """This class defines the message header. The fields are plain
+    attributes, see WIRE_VERSION for how they are packed. The ids are
+    kept decoded as 20-byte strings."""
+
+    __slots__ = ('type', 'id', 'seq', 'control', 'crid', 'src', 'dst',
+                 'nxt',     # next hop, -1 means unset
+                 'ttl',
+                 'hit',     # test purpose
+                 'hop', 'data',
+                 'raw')     # wire format of the header, only for a LazyHeader
 
     def __init__(self):
+        self.reset()
+        pass
+
+    def reset(self):
+        """Set all the fields to their initial values."""
+        self.type = 0
+        self.id = NULL_ID
+        self.seq = 0
+        self.control = 0
+        self.crid = NULL_ID
+        self.src = 0
+        self.dst = 0
         self.nxt = -1
         self.ttl = 64
+        self.hit = 0
+        self.hop = 0
         self.data = ''
         pass
 
+    def pack(self):
+        """Return the header in its wire format."""
+        flags = 0
+        body = ()
+        if self.seq:
+            flags = F_SEQ
+            body = (self.seq & 0xffffffff,)
+        if self.hit:
+            flags |= F_HIT
+            body += (self.hit & 0xffff,)
+        if self.id != NULL_ID:
+            flags |= F_ID
+            body += (self.id,)
+        control = self.control
+        if control & CACHED_BIT:
+            flags |= F_CRID
+            body += (self.crid,)
+        fmt = LAYOUTS[flags]
+        return fmt.pack(WIRE_VERSION << 4 | flags, fmt.size, self.type, control & 0xff,
+                        self.ttl & 0xffff, self.hop & 0xffff, self.dst, self.nxt,
+                        self.src, *body)
+
+    def pack_into(self, buf, offset=0):
+        """Write the header into buf at offset, return its length."""
+        head = self.pack()
+        BODY[len(head)].pack_into(buf, offset, head)
+        return len(head)
+
+    def unpack_from(self, buf, offset=0):
+        """Read the header from buf at offset, buf may be a memoryview.
+        Return the length of the header."""
+        (vf, n, self.type, self.control, self.ttl, self.hop,
+         self.dst, self.nxt, self.src) = PREFIX.unpack_from(buf, offset)
+        if vf >> 4 != WIRE_VERSION:
+            raise ValueError('unknown header version %i' % (vf >> 4))
+        self.unpack_body(vf, buf, offset + PREFIX.size)
+        return n
+
+    def unpack_body(self, vf, buf, offset):
+        """Read the fields after the prefix from buf at offset, vf is
+        the first byte of the prefix."""
+        body = BODIES[vf & 0xf].unpack_from(buf, offset)
+        i = 0
+        if vf & F_SEQ:
+            self.seq = body[0]
+            i = 1
+        else:
+            self.seq = 0
+        if vf & F_HIT:
+            self.hit = body[i]
+            i += 1
+        else:
+            self.hit = 0
+        if vf & F_ID:
+            self.id = body[i]
+            i += 1
+        else:
+            self.id = NULL_ID
+        if vf & F_CRID and self.control & CACHED_BIT:
+            self.crid = body[i]
+        else:
+            self.crid = NULL_ID
+        pass
+
     def send(self):
         """Convert struct to stream."""
-        return buffer(self)[:] + self.data
+        return self.pack() + self.data
 
     def recv(self, bytes):
-        """Convert stream to struct."""
-        head_len = sizeof(self)
-        memmove(addressof(self), bytes, head_len)
-        self.data = bytes[head_len:]
+        """Convert stream to struct. bytes is either a str or a memoryview
+        of a frame, the payload is copied out of the view only once."""
+        n = self.unpack_from(bytes)
+        if bytes.__class__ is memoryview:
+            self.data = bytes[n:].tobytes()
+        else:
+            self.data = bytes[n:]
         pass
 
-    @property
-    def id(self):
-        return self.get_char_array(self._id)
-
-    @id.setter
-    def id(self, val):
-        self.set_char_array(self._id, val)
-
-    @property
-    def visited(self):
-        return self.get_char_array(self._visited)
-
-    @visited.setter
-    def visited(self, val):
-        self.set_char_array(self._visited, val)
+    def wrap(self, bytes):
+        """Like recv(), but the header stays in its wire format and turns
+        into a LazyHeader. Only for a blank header, see blank_header()."""
+        (vf, n, self.type, self.control, self.ttl, self.hop,
+         self.dst, self.nxt, self.src) = PREFIX.unpack_from(bytes)
+        if vf >> 4 != WIRE_VERSION:
+            raise ValueError('unknown header version %i' % (vf >> 4))
+        if bytes.__class__ is memoryview:
+            self.raw = bytes[:n].tobytes()
+            self.data = bytes[n:].tobytes()
+        else:
+            self.raw = bytes[:n]
+            self.data = bytes[n:]
+        self.__class__ = LazyHeader
+        pass
 
-    @property
-    def crid(self):
-        return self.get_char_array(self._crid)
+    def copy(self):
+        """Return a copy of the header, the payload is shared."""
+        hdr = blank_header()
+        hdr.type = self.type
+        hdr.id = self.id
+        hdr.seq = self.seq
+        hdr.control = self.control
+        hdr.crid = self.crid
+        hdr.src = self.src
+        hdr.dst = self.dst
+        hdr.nxt = self.nxt
+        hdr.ttl = self.ttl
+        hdr.hit = self.hit
+        hdr.hop = self.hop
+        hdr.data = self.data
+        return hdr
 
-    @crid.setter
-    def crid(self, val):
-        self.set_char_array(self._crid, val)
+    def __getstate__(self):
+        return (self.pack(), self.data)
 
-    def set_char_array(self, dest, src, length=DIGEST_LEN):
-        memmove(addressof(dest), src, length)
+    def __setstate__(self, state):
+        self.unpack_from(state[0])
+        self.data = state[1]
         pass
 
-    def get_char_array(self, src, length=DIGEST_LEN):
-        p = cast(addressof(src), POINTER(c_char * length))
-        return p.contents.raw
-
     def set_cached_bit(self):
-        self.control |= 0x10
+        self.control |= CACHED_BIT
         pass
 
     def unset_cached_bit(self):
-        self.control &= 0xEF
+        self.control &= ~CACHED_BIT & 0xFF
         pass
 
     def is_cached_bit_set(self):
-        return self.control & 0x10
+        return self.control & CACHED_BIT
 
     def swap_src_dst(self):
         tvar = self.src
@@ -109,3 +249,62 @@ class MessageHeader(Structure):
         pass
 
     pass
+
+
+class LazyHeader(MessageHeader):
+    """A received header kept in its wire format, most hops only route a
+    packet. Only the fields of the prefix are decoded at first, reading
+    any other field decodes the rest. The fields in LAZY are written as
+    usual, packing the header packs its prefix again and copies the rest
+    of raw. Writing any other field turns the header into a
+    MessageHeader."""
+
+    __slots__ = ()
+
+    def __getattr__(self, name):
+        """Called for the fields not decoded yet."""
+        if name not in FIELDS:
+            raise AttributeError(name)
+        self.decode()
+        return getattr(self, name)
+
+    def __setattr__(self, name, val):
+        if name not in LAZY:
+            self.materialize()
+        object.__setattr__(self, name, val)
+        pass
+
+    def decode(self):
+        """Decode the fields after the prefix, the header stays lazy."""
+        raw = self.raw
+        object.__setattr__(self, '__class__', MessageHeader)
+        self.unpack_body(ord(raw[0]), raw, PREFIX.size)
+        self.__class__ = LazyHeader
+        pass
+
+    def materialize(self):
+        """Decode the whole header, turn it into a MessageHeader."""
+        self.decode()
+        object.__setattr__(self, '__class__', MessageHeader)
+        self.raw = None
+        pass
+
+    def pack(self):
+        raw = self.raw
+        return PREFIX.pack(ord(raw[0]), len(raw), self.type, self.control & 0xff,
+                           self.ttl & 0xffff, self.hop & 0xffff, self.dst,
+                           self.nxt, self.src) + raw[PREFIX.size:]
+
+    def copy(self):
+        """Return a copy of the header, still lazy, the payload is shared."""
+        hdr = blank_header()
+        hdr.wrap(self.pack())
+        hdr.data = self.data
+        return hdr
+
+    def __reduce_ex__(self, proto):
+        self.materialize()
+        return self.__reduce_ex__(proto)
+
+    pass
+
@@ -19,39 +19,99 @@ import random
 import string
 import struct
 import socket
+import zlib
+import cPickle
 import itertools
 import threading
-from multiprocessing import Manager, Queue
+from collections import OrderedDict
+from multiprocessing import Process, Queue
+from Queue import Empty, Full
 
 from common import *
 from link import Link
+from transport import get_transport
+from framing import LINK_CLOSE
+from reactor import get_reactor, LoopQueue
+from scheduler import get_scheduler
+from shaper import TokenBucket
+from fastqueue import FastQueue
+from routing import *
 from messageheader import *
 
 OVERLAY_CMD = "vr|cmd"
+ROUTE_MEMO  = 4096       # max number of destinations memoized by lazy routing
+UNREACHABLE = object()   # rmemo value of a destination without a path
+BATCH_SIZE  = 64         # max number of packets processed per wake-up
+TOPOLOGIES  = {}         # parsed topology files, shared by the routers of a process
+SHARD_QUEUE = 1024       # max number of batches waiting for a shard process
+STOP_WAIT   = 1.0        # seconds an idle thread waits before it checks whether the router stopped
 
 class Router(object):
     def __init__(self, args):
         self.argsdict  = args                        # Keep a backup of args, other module may need it
         self.vrid      = args['vrid']                # The logical id instead of (ip,port)
+        self.pid       = os.getpid()                 # upperapps run in other processes
         self.id        = self.generate_myid()
         self.ip        = args['ip']                  # ipv4 address, never use 127.0.0.1
         self.iport     = args['iport']               # port for incoming message
         self.routers   = set()
-        self.manager   = Manager()
-        self.rtable    = self.manager.dict()
+        self.rtable    = None                        # next-hop array in shared memory, indexed by vrid
+        self.frtable   = None                        # per-flow next hops, see enable_flow_routes
+        self.rmemo     = None                        # destinations routed on demand, only for 'lazy'
         self.pathdict  = {}                          # a dict contains all the hops in each path
         self.topology  = {}                          # a dict contains all the links and link properties
+        self.adj       = {}                          # adjacency index of topology, adj[x][y] is the weight
         self.l2p       = args['l2p']                 # logical node to physical node
         self.ihandlers = [self.bypass_handler]
+        self.bhandlers = {self.bypass_handler: self.bypass_batch}   # optional batch entry of ihandlers
+        self.lazy      = True                        # no ihandler needs more than the prefix, see LazyHeader
+        self.hfilters  = {}                          # ihandler -> (types, where), the packets it is called for
+        self.dispatch  = {}                          # (type, local) -> ihandlers called, compiled on demand
         self.logfh     = args['logfh']
 
         self.ibandwidth = args['ibandwidth']         # aggregated ingress bandwidth in bytes, zero means inf
         self.ebandwidth = args['ebandwidth']         # aggregated egress bandwidth in bytes, zero meas inf
+        self.burst = args.get('burst', 0)            # bucket depth of traffic shapers in bytes, zero means default
+        self.backlog = args.get('backlog', 0)        # serialization backlog of the links in bytes, zero means unbounded
+        self.coalesce = args.get('coalesce', 0)      # max delay in seconds to coalesce link writes, zero means none
+        self.linkmode = args.get('transport', 'tcp') # transport of the packets between nodes, tcp or udp
+        self.mtu = args.get('mtu', 0)                # max datagram size of the udp transport, zero means default
+        self.engine = args.get('engine', 'thread')   # thread or reactor, how the process serves its routers
+        self.shards = args.get('shards', 0)          # processes running the ihandlers, zero or one means none
+        self.squeues = []                            # input queues of the shard processes, see start_shards
+        self.procs = []                              # shard and upperapp processes, ended by stop()
+        self.running = True                          # False once stop() is called
         self.queuesize = 15000 if args['queuesize'] == 0 else args['queuesize']              # zero means inf
         self.queuepolicy = args['queuepolicy']       # queuing policy, a function reference
-        self.iqueue = Queue(self.queuesize)          # SR processing limit is 15k pkts/s
-        self.equeue = Queue(15000)                   # SR processing limit is 15k pkts/s
-        self.cqueue = Queue(15000)                   # SR processing limit is 15k pkts/s
+        self.iqueue = FastQueue(self.queuesize)      # SR processing limit is 15k pkts/s
+        self.equeue = FastQueue(15000)               # SR processing limit is 15k pkts/s
+        self.cqueue = FastQueue(15000)               # SR processing limit is 15k pkts/s
+        self.aqueue = None                           # packets sent by upperapps in other processes
+        if args.get('upperapp', None):
+            self.cqueue = Queue(15000)
+            self.aqueue = Queue(15000)
+        if self.shards > 1 and self.aqueue is None:
+            self.aqueue = Queue(15000)               # the shards send their results through it
+
+        self.reactor = None                          # event loop of the process, only for the reactor engine
+        if self.engine == 'reactor':
+            self.reactor = get_reactor()
+            self.equeue = LoopQueue(self.reactor, self.forward,
+                                    TokenBucket(self.ebandwidth, self.burst), 15000, BATCH_SIZE)
+            self.iqueue = LoopQueue(self.reactor, self.process_batch,
+                                    TokenBucket(self.ibandwidth, self.burst), self.queuesize, BATCH_SIZE,
+                                    self.equeue)
+            get_scheduler(self.reactor)
+
+        self.transport = get_transport()             # channels to other processes, shared by the links
+        self.transport.coalesce = self.coalesce
+        self.transport.addr = (self.ip, self.iport)
+        if self.reactor is not None:
+            self.transport.reactor = self.reactor
+        self.transport.register(self.vrid, self.accept_link)
+        self.dgram = None                            # datagram port on iport+1, only for the udp transport
+        if self.linkmode == 'udp':
+            self.dgram = self.transport.serve_udp(self.iport + 1, self.mtu)
         pass
 
     def generate_myid(self):
@@ -74,108 +134,105 @@ class Router(object):
         pass
 
     def read_topology_from_file(self, fn):
-        """Read the overlay topology from a file, store link properties."""
-        for line in open(fn, 'r').readlines():
-            line = line.strip()
-            if line.startswith('#'):
-                continue
-            m = re.search(r"(\d+)\s*->\s*(\d+)\s*(\d*)\s*(\d*)\s*([.\d]*)\s*([.\d]*)", line).groups()
-            vr1 = int(m[0])
-            vr2 = int(m[1])
-            weight = int(m[2]) if len(m[2]) else 1
-            bandwidth = int(m[3]) if len(m[3]) and m[3] != '0' else float('Inf')
-            delay = float(m[4]) if len(m[4]) else 0
-            lossrate = float(m[5]) if len(m[5]) else 0
-            self.routers.add(vr1)
-            self.routers.add(vr2)
-            link = tuple(sorted([vr1,vr2]))
-            self.topology[link] = {'weight':weight, 'bandwidth':bandwidth,
-                                   'delay':delay, 'lossrate':lossrate}
+        """Read the overlay topology from a file, store link properties.
+        The routers of a worker process share the parsed topology."""
+        key = (os.path.abspath(fn), os.path.getmtime(fn))
+        if key not in TOPOLOGIES:
+            routers, topology = read_topology(fn)
+            TOPOLOGIES[key] = (routers, topology, build_adjacency(topology))
+        routers, topology, adj = TOPOLOGIES[key]
+        self.routers.update(routers)
+        if self.topology:
+            self.topology.update(topology)
+            self.adj = build_adjacency(self.topology)
+        else:
+            self.topology = topology
+            self.adj = adj
+        self.rtable = create_rtable(max(self.routers) + 1 if self.routers else 0)
+        pass
+
+    def enable_flow_routes(self):
+        """Create the per-flow next hops, a shared array indexed by (src,
+        dst) over the vrids, -1 means the flow follows rtable. It must be
+        created before forking, like rtable, an upperapp changing the
+        routes of single flows asks for it, see hook_upperapp."""
+        n = len(self.rtable)
+        self.frtable = create_rtable(n * n)
+        pass
+
+    def set_flow_route(self, src, dst, nexthop):
+        """Route the flow from src to dst via nexthop, -1 means rtable."""
+        self.frtable[src * len(self.rtable) + dst] = nexthop
         pass
 
+    def flow_next_hop(self, src, dst):
+        """Return the next hop of the flow from src to dst."""
+        nexthop = -1
+        if self.frtable is not None:
+            nexthop = self.frtable[src * len(self.rtable) + dst]
+        return nexthop if nexthop >= 0 else self.rtable[dst]
+
+    def load_routing_file(self, fn):
+        """Load the routing computed once for the whole job, see
+        compute_rtable_file(). The file is mapped as the pathdict,
+        and my own next hops go into rtable."""
+        self.pathdict = PathStore.load(fn)
+        self.pathdict.load_row(self.vrid, self.rtable)
+        pass
+
+    def enable_lazy_routing(self):
+        """Leave rtable empty at start, a destination is routed the first
+        time a packet goes to it, see route_on_demand()."""
+        self.rmemo = OrderedDict()
+        pass
+
+    def route_on_demand(self, dst):
+        """Compute the next hop to dst and memoize it in rtable. Every node
+        on the found path shares the same next hop, so they are memoized
+        as well. A dst without a path is memoized as UNREACHABLE, -1 is
+        returned for it without searching again. The oldest destinations
+        are forgotten when the memo is full."""
+        if self.rmemo.get(dst, None) is UNREACHABLE:
+            return -1
+        path = bidirectional_dijkstra(self.adj, self.vrid, dst)
+        if path is None or len(path) < 2:
+            self.rmemo[dst] = UNREACHABLE
+            nexthop = -1
+        else:
+            nexthop = path[1]
+            for x in path[1:]:
+                if x not in self.rmemo:
+                    self.rtable[x] = nexthop
+                    self.rmemo[x] = True
+        while len(self.rmemo) > ROUTE_MEMO:
+            x, _ = self.rmemo.popitem(last=False)
+            self.rtable[x] = -1
+        return nexthop
+
     def build_routing_table(self, src):
         """Use Dijkstra algorithm to find the shortest path."""
-        Q = set(self.routers)
-        dist = {}
-        prev = {}
+        dist, prev = dijkstra(self.adj, src)
+        first = first_hops(prev, src)
         for x in self.routers:
-            dist[x] = 0 if src==x else float("Inf")
-            prev[x] = None
-        while len(Q):
-            m = min( [(dist[x],x) for x in Q] )[1]
-            if dist[m] == float("Inf"):
-                break
-            for n in self.neighbours(m):
-                alt = dist[m] + self.weight(m,n)
-                if alt < dist[n]:
-                    dist[n] = alt
-                    prev[n] = m
-            Q.difference_update(set([m]))
-        for x in self.routers:
-            q = x
-            while True:
-                p = prev[q]
-                if p == src or p == None:
-                    self.rtable[x] = q
-                    break
-                else:
-                    q = p
+            self.rtable[x] = first.get(x, x)
         pass
 
     def neighbours(self, src):
         """Given a specific node, return its neighbour set in the graph.
         Default value for src is router's own ID."""
-        r = []
-        for x, y in self.topology:
-            if src == x:
-                r.append(y)
-            elif src == y:
-                r.append(x)
-        return r
+        return list(self.adj.get(src, ()))
 
     def weight(self, m, n):
         """Given two vertices, return the weight of corresponding edge."""
-        link = tuple(sorted([m, n]))
-        w = self.topology[link]['weight'] if link in self.topology else float("Inf")
-        w = 0 if m==n else w
-        return w
-
-    def floyd_warshall(self, routers):
-        """Use Floyd-Warshall algorithm to calculate the shortest path
-        between any two nodes."""
-        path = {}
-        next = {}
-
-        # Initialize
-        for i, j in itertools.product(routers, repeat=2):
-            path[(i, j)] = self.weight(i, j)
-
-        for k in routers:
-            for i in routers:
-                for j in routers:
-                    if path[(i, k)] + path[(k, j)] < path[(i, j)]:
-                        path[(i, j)] = path[(i, k)] + path[(k, j)]
-                        next[(i, j)] = k
-        return path, next
-
-    def fw_get_path(self, i, j, path, next):
-        """Reconstruct the shortest path between two nodes, given the
-        output from floyd_warshall algorithm."""
-        if path[(i, j)]==float('Inf'):
-            return None
-        if not next.has_key((i, j)):
-            return []
-        itm = next[(i, j)]
-        return self.fw_get_path(i, itm, path, next) + [itm] + self.fw_get_path(itm, j, path, next)
+        if m == n:
+            return 0
+        return self.adj.get(m, {}).get(n, float("Inf"))
 
     def build_pathdict(self):
-        """Reconstruct the shortest path between two nodes, given the
-        output from floyd_warshall algorithm."""
-        routers = sorted(self.routers)
-        path, next = self.floyd_warshall(routers)
-        for i, j in itertools.permutations(routers, 2):
-            p = self.fw_get_path(i, j, path, next)
-            self.pathdict[(i, j)] = [i] + p + [j]
+        """Build the pathdict of all the symmetric shortest paths. It is a
+        PathStore, the paths are reconstructed from a predecessor matrix
+        when they are looked up."""
+        self.pathdict = PathStore.build(self.adj)
         print self.vrid, ": pathdict construction done."
         pass
 
@@ -237,9 +294,10 @@ class Router(object):
     def build_symmetric_routing_table(self, src):
         """The difference between this function and build_routing_table() is
         that this function guarantees the A -> B path and B -> A path are the
-        same."""
+        same. Without a pathdict, only the tree of src is computed, other
+        paths are computed when they are looked up."""
         if not self.pathdict:
-            self.build_pathdict()
+            self.pathdict = SymmetricPaths(self.adj)
         for dst in self.routers:
             path = self.pathdict.get((src,dst), None)
             if path is not None and len(path) > 1:
@@ -249,26 +307,11 @@ class Router(object):
     def shortest_paths(self, src):
         """Use Dijkstra algorithm to find all shortest paths from the src."""
         paths = []
-        Q = set(self.routers)
-        dist = {}
-        prev = {}
-        for x in self.routers:
-            dist[x] = 0 if src == x else float("Inf")
-            prev[x] = None
-        while len(Q):
-            m = min( [(dist[x],x) for x in Q] )[1]
-            if dist[m] == float("Inf"):
-                break
-            for n in self.neighbours(m):
-                alt = dist[m] + self.weight(m, n)
-                if (alt < dist[n]):
-                    dist[n] = alt
-                    prev[n] = m
-            Q.difference_update(set([m]))
+        dist, prev = dijkstra(self.adj, src)
         for q in self.routers:
             tp = [q]
             while True:
-                p = prev[q]
+                p = prev.get(q, None)
                 tp.insert(0,p)
                 if p == src or p == None:
                     break
@@ -288,29 +331,93 @@ class Router(object):
         """This hanlder is always the last handler in ihandlers.
         It distributes the packets into cqueue or equeue."""
         if msg_hdr.dst == self.vrid:
-            self.cqueue.put(msg_hdr, True)
+            self.deliver([msg_hdr])
         else:
             self.equeue.put(msg_hdr, True)
         return True
 
-    def register_ihandler(self, func):
-        """Insert the func into the head of ihandlers array."""
+    def bypass_batch(self, hdrs, router):
+        """Batch entry of bypass_handler."""
+        local = [ x for x in hdrs if x.dst == self.vrid ]
+        if len(local) < len(hdrs):
+            self.equeue.put_many([ x for x in hdrs if x.dst != self.vrid ], True)
+        if local:
+            self.deliver(local)
+        return [True] * len(hdrs)
+
+    def deliver(self, hdrs):
+        """Put the packets for me into cqueue. The reactor does not wait
+        for a slow upperapp, the packets cqueue has no room for are
+        dropped."""
+        block = self.reactor is None
+        try:
+            if isinstance(self.cqueue, FastQueue):
+                self.cqueue.put_many(hdrs, block)
+            else:
+                for x in hdrs:
+                    self.cqueue.put(x, block)
+        except Full:
+            pass
+        pass
+
+    def register_ihandler(self, func, bfunc=None, lazy=False, types=None, where=None, shardable=True):
+        """Insert the func into the head of ihandlers array. bfunc is
+        an optional batch entry of func, it takes a list of packets
+        and returns a list of done flags. lazy tells func copes with a
+        LazyHeader: it only writes the fields a LazyHeader patches in
+        place, or, with types, it is only called for packets it
+        decodes anyway. As long as all the ihandlers are lazy, the
+        links keep the headers they receive in the wire format, a
+        packet is then forwarded without encoding its header, and
+        without decoding more than its prefix unless an ihandler reads
+        the other fields. types is the list of message types func is
+        called for, where is 'local' for the packets to me, 'transit'
+        for the others, None means all of them. shardable False tells
+        func keeps state the packets do not reach, e.g. a thread
+        advertising its cache, each shard would only see its own copy
+        of it, so the router runs without shards."""
+        if not shardable and self.shards > 1:
+            print "Router %i runs without shards, its ihandler keeps state the packets do not reach" % self.vrid
+            self.shards = 0
         self.ihandlers.insert(-1, func)
+        if bfunc is not None:
+            self.bhandlers[func] = bfunc
+        if types is not None or where is not None:
+            self.hfilters[func] = (None if types is None else frozenset(types), where)
+        self.dispatch = {}
+        if not lazy:
+            self.lazy = False
+            for x in self.l2p.values():
+                if isinstance(x, dict) and 'link' in x:
+                    x['link'].lazy = False
         pass
 
     def start(self):
-        """Start the routing service. Set up links to neighbours."""
-        t0 = threading.Thread(target=self.service, args=())
-        t0.deamon = True
-        t0.start()
+        """Start the routing service. Set up links to neighbours. With the
+        reactor engine, the reactor serves iport and runs the processor
+        and the egress of the router, no thread is started for them."""
+        if self.shards > 1:
+            self.start_shards()
+
+        if self.reactor is not None:
+            self.service()
+        else:
+            t0 = threading.Thread(target=self.service, args=())
+            t0.deamon = True
+            t0.start()
+
+            t1 = threading.Thread(target=self.processor, args=())
+            t1.daemon = True
+            t1.start()
 
-        t1 = threading.Thread(target=self.processor, args=())
-        t1.daemon = True
-        t1.start()
+            t2 = threading.Thread(target=self.link_egress, args=())
+            t2.daemon = True
+            t2.start()
 
-        t2 = threading.Thread(target=self.link_egress, args=())
-        t2.daemon = True
-        t2.start()
+        if self.aqueue is not None:
+            t3 = threading.Thread(target=self.app_egress, args=())
+            t3.daemon = True
+            t3.start()
 
         for neighbour in self.neighbours(self.vrid):
             if self.vrid < neighbour:
@@ -320,47 +427,190 @@ class Router(object):
                 pass
         pass
 
+    def stop(self):
+        """Stop this router alone, the other routers of the process go on.
+        The far ends of its links are told to close them, its threads
+        end within STOP_WAIT, its shards and upperapps are terminated.
+        The transport and its channels stay, they are shared."""
+        self.running = False
+        self.transport.unregister(self.vrid)
+        for link in self.links():
+            try:
+                link.channel.control(link.ends[0], link.ends[1], LINK_CLOSE)
+            except Exception, err:
+                print "Exception:Router.stop():", self.vrid, err
+            self.transport.close_link(link)
+        if self.reactor is not None:
+            self.iqueue.close()
+            self.equeue.close()
+        for p in self.procs:
+            if p.is_alive():
+                p.terminate()
+        pass
+
+    def links(self):
+        """Return the links set up to the neighbours."""
+        return [ x['link'] for x in self.l2p.values() if isinstance(x, dict) and 'link' in x ]
+
     def service(self):
-        """Listen on iport, accept incomming connections. For a new
-        connection, the first 4 bytes indicate neighbor id."""
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        s.bind( ('', self.iport) )
-        s.listen(1)
-        while True:
-            conn, addr = s.accept()
-            neighbour = struct.unpack('!I', get_data(4, conn)[0])[0]
-            link_property = self.topology[(neighbour, self.vrid)]
-            tlink = Link(link_property, self.iqueue)
-            self.l2p[neighbour] = {'addr':addr, 'link':tlink}
-            tlink.setup(conn)
+        """Listen on iport, accept incomming connections. Links are opened
+        by the remote side over the accepted channels, see accept_link.
+        The routers in a worker process share iport. With the reactor
+        engine it returns at once."""
+        self.transport.serve(self.iport)
+        pass
+
+    def accept_link(self, neighbour, channel, opts):
+        """A neighbour opened its link to me over the channel. opts names
+        the shared-memory rings if the neighbour is co-located, or its
+        datagram port if it uses the udp transport."""
+        link_property = self.topology[(neighbour, self.vrid)]
+        tlink = Link(link_property, self.iqueue, self.backlog)
+        tlink.lazy = self.lazy
+        if self.reactor is not None:
+            tlink.source = self.equeue
+        self.transport.attach(tlink, self.vrid, neighbour, channel)
+        if 'tx' in opts:
+            tlink.attach_rings(opts)
+        elif 'udp' in opts and self.dgram is not None:
+            tlink.use_udp(self.dgram, (channel.addr[0], int(opts['udp'])))
+        self.l2p[neighbour] = {'addr':channel.addr, 'link':tlink}
         pass
 
     def setup_link(self, neighbour):
-        """Establish TCP connection to a neighbor. Each TCP connection
-        corresponds to a physical link in the real-world."""
+        """Establish the link to a neighbor. All the links between two
+        processes share one TCP connection, see Transport. A co-located
+        neighbour gets its packets through shared-memory rings, the TCP
+        connection is then only used for the doorbell. With the udp
+        transport, packets to other nodes go in datagrams. A neighbour
+        in the same worker process gets the packets directly."""
         addr = self.l2p[neighbour]
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        # Liang: new feature
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
-        while True:
-            try:
-                time.sleep(random.randint(1,5))
-                print "connecting to %s %s" % (str(neighbour), str(addr))
-                s.connect(addr)
-                s.send(struct.pack('!I', self.vrid))
-                break
-            except Exception, err:
-                print "Exception:Router.setup_link():connect:", err
+        local = self.transport.is_local(neighbour)
+        channel = self.transport.local if local else self.transport.connect(addr)
 
         link_property = self.topology[(self.vrid, neighbour)]
-        tlink = Link(link_property, self.iqueue)
+        tlink = Link(link_property, self.iqueue, self.backlog)
+        tlink.lazy = self.lazy
+        if self.reactor is not None:
+            tlink.source = self.equeue
+        self.transport.attach(tlink, self.vrid, neighbour, channel)
+        opts = {}
+        if not local and addr[0] == self.ip:
+            try:
+                opts = tlink.create_rings()
+            except Exception, err:
+                print "Exception:Router.setup_link():rings:", err
+        if not local and not opts and self.dgram is not None:
+            opts['udp'] = self.dgram.port
+            tlink.use_udp(self.dgram, (addr[0], addr[1] + 1))
+        channel.open(self.vrid, neighbour, opts)
         self.l2p[neighbour] = {'addr':addr, 'link':tlink}
-        tlink.setup(s)
         pass
 
     def send(self, msg_hdr):
         """Interface for the upperapp to send a message"""
-        self.equeue.put(msg_hdr, True)
+        if os.getpid() != self.pid:
+            self.aqueue.put(msg_hdr, True)
+        else:
+            self.equeue.put(msg_hdr, True)
+        pass
+
+    def app_egress(self):
+        """Move the messages sent by upperapps in other processes into
+        equeue. A shard sends the results of a batch as a pair of lists,
+        the packets to forward and those for me."""
+        while self.running:
+            try:
+                item = self.aqueue.get(True, STOP_WAIT)
+                if isinstance(item, tuple):
+                    if item[0]:
+                        self.equeue.put_many(item[0], True)
+                    if item[1]:
+                        self.deliver(item[1])
+                else:
+                    self.equeue.put(item, True)
+            except Empty:
+                pass
+            except Exception, err:
+                print "Exception:Router.app_egress():", self.vrid, err
+        pass
+
+    def start_shards(self):
+        """Fork the shard processes. Each runs the ihandlers with its own
+        copy of the cache strategy over the packets whose content id
+        hashes to it, so the cache is partitioned by content id and no
+        lock is shared. The ihandlers must be registered before."""
+        queues = [ Queue(SHARD_QUEUE) for i in range(self.shards) ]
+        for k, q in enumerate(queues):
+            p = Process(target=self.shard_processor, args=(k, q))
+            p.daemon = True
+            p.start()
+            self.procs.append(p)
+        self.squeues = queues
+        pass
+
+    def shard_batch(self, hdrs):
+        """Hand a batch to the shards by content id, the packets of a flow
+        share their content id, so they stay in order. A packet without
+        one, e.g. BFBDST, goes to every shard so that all of them keep
+        the same neighbour state, only the first shard sends its results.
+        These packets are pickled once, here, instead of by the feeder
+        thread of every queue at the same time. The reactor does not wait
+        for a busy shard, the packets it has no room for are dropped."""
+        n = len(self.squeues)
+        parts = [ [] for i in range(n) ]
+        common = []
+        for msg_hdr in hdrs:
+            cid = msg_hdr.id
+            if cid == NULL_ID:
+                common.append(msg_hdr)
+            else:
+                parts[zlib.crc32(cid) % n].append(msg_hdr)
+        if common:
+            common = cPickle.dumps(common, 2)
+        block = self.reactor is None
+        for k, q in enumerate(self.squeues):
+            try:
+                if parts[k]:
+                    q.put((parts[k], False), block)
+                if common:
+                    q.put((common, k > 0), block)
+            except Full:
+                pass
+        pass
+
+    def shard_processor(self, k, queue):
+        """Run the ihandlers over the batches of shard k, in the shard
+        process. The packets the pipeline forwards or delivers are sent
+        back to the router through aqueue, a batch of a packet copied
+        to every shard comes pickled, see shard_batch(), and sends
+        nothing back unless k is 0. The shard exits once the router
+        process is gone."""
+        self.squeues = []
+        self.reactor = None
+        self.equeue = FastQueue()
+        self.cqueue = FastQueue()
+        while True:
+            try:
+                try:
+                    hdrs, mirror = queue.get(True, 1)
+                except Empty:
+                    if os.getppid() != self.pid:
+                        break
+                    continue
+                if isinstance(hdrs, str):
+                    hdrs = cPickle.loads(hdrs)
+                self.process_batch(hdrs)
+                out = []
+                for q in (self.equeue, self.cqueue):
+                    try:
+                        out.append(q.get_many(sys.maxint, False))
+                    except Empty:
+                        out.append([])
+                if not mirror and (out[0] or out[1]):
+                    self.aqueue.put(tuple(out), True)
+            except Exception, err:
+                print "Exception:Router.shard_processor():", self.vrid, k, err
         pass
 
     def recv(self):
@@ -376,68 +626,145 @@ class Router(object):
         """Process outgoing messages on a link. It checks whether the
         nexthop is set, set nexthop by using rtable if it is not set.
         Liang: REMARK: Now the upperapp bandwidth compete with egress, needs to be fixed, or NOT?"""
-        tc = 0
-        th = self.ebandwidth / 1.0
-        t0 = time.time()
-        t1 = t0
-        while True:
+        shaper = TokenBucket(self.ebandwidth, self.burst)
+        while self.running:
             try:
                 # aggregated egress traffic shaping
-                t1 = time.time()
-                if t1 - t0 < 1.0:
-                    if tc >= th:
-                        time.sleep(0.01)
-                        continue
-                else:
-                    t0 = t1
-                    tc = 0
-
-                msg_hdr = self.equeue.get(True)
-                tc += len(msg_hdr.data)
+                hdrs = self.equeue.get_many(BATCH_SIZE, True, STOP_WAIT)
+                shaper.consume(sum([ len(x.data) for x in hdrs ]))
+                self.forward(hdrs)
+            except Empty:
+                pass
+            except Exception, err:
+                print "Exception:Router.link_egress():", self.vrid, err
+        pass
 
+    def forward(self, hdrs):
+        """Group a batch by next hop, then each link gets its packets in
+        one go, in their original order. A packet whose next hop cannot
+        be found is dropped alone, as is a packet to a destination
+        without a route."""
+        links = {}
+        for msg_hdr in hdrs:
+            try:
                 nexthop = self.rtable[msg_hdr.dst] if msg_hdr.nxt < 0 else msg_hdr.nxt
-                tlink = self.l2p[nexthop]['link']
-                tlink.send(msg_hdr)
+                if nexthop < 0 and self.rmemo is not None:
+                    nexthop = self.route_on_demand(msg_hdr.dst)
             except Exception, err:
-                print "Exception:Router.link_egress():", self.vrid, err
+                print "Exception:Router.forward():", self.vrid, msg_hdr.dst, err
+                continue
+            if nexthop < 0:
+                continue
+            links.setdefault(nexthop, []).append(msg_hdr)
+        for nexthop, lhdrs in links.items():
+            try:
+                self.l2p[nexthop]['link'].send_many(lhdrs)
+            except Exception, err:
+                print "Exception:Router.link_egress():", self.vrid, nexthop, err
         pass
 
     def processor(self):
         """Simulate the processor of a router, proecess message in the queue here."""
-        tc = 0
-        th = self.ibandwidth / 1.0
-        t0 = time.time()
-        t1 = t0
+        shaper = TokenBucket(self.ibandwidth, self.burst)
 
-        while True:
+        while self.running:
             # aggregated ingress traffic shaping
-            t1 = time.time()
-            if t1 - t0 < 1.0:
-                if tc >= th:
-                    time.sleep(0.01)
-                    continue
-            else:
-                t0 = t1
-                tc = 0
-
-            msg_hdr = self.iqueue.get(True)
-            tc += len(msg_hdr.data)
+            try:
+                hdrs = self.iqueue.get_many(BATCH_SIZE, True, STOP_WAIT)
+            except Empty:
+                continue
+            shaper.consume(sum([ len(x.data) for x in hdrs ]))
 
             try:
-                done = False
-                for func in self.ihandlers:
-                    try:
-                        done = func(msg_hdr, self)
-                    except Exception, err:
-                        print 'Exception:processor:ihandlers:', self.vrid, err
-                        self.logfh.write("EXCEPT:processor:ihandler:%s\n" % (str(err)))  # Liang: tmp use
-                    if done:
-                        break
+                self.process_batch(hdrs)
             except Exception, err:
                 print "Exception:Router.processor():", err
                 self.logfh.write("EXCEPT:processor:%s\n" % (str(err)))  # Liang: tmp use
         pass
 
+    def process_batch(self, hdrs):
+        """Run the ihandlers over a batch of packets. A packet is handled
+        by the pipeline of its type and of whether it is for me, see
+        pipeline(). A packet no ihandler cares about cuts through to
+        bypass_batch at once. The packets of a pipeline keep their order,
+        packets of different pipelines may pass each other. With shards,
+        the batch is handed to them instead, see shard_batch()."""
+        if self.squeues:
+            self.shard_batch(hdrs)
+            return
+        if len(self.ihandlers) == 1:
+            self.bypass_batch(hdrs, self)
+            return
+        if not self.hfilters:
+            self.run_pipeline(self.ihandlers, hdrs)
+            return
+        vrid = self.vrid
+        dispatch = self.dispatch
+        groups = {}
+        cut = []
+        for msg_hdr in hdrs:
+            key = (msg_hdr.type, msg_hdr.dst == vrid)
+            funcs = dispatch.get(key, None)
+            if funcs is None:
+                funcs = self.pipeline(*key)
+            if len(funcs) > 1:
+                groups.setdefault(funcs, []).append(msg_hdr)
+            else:
+                cut.append(msg_hdr)
+        if cut:
+            self.bypass_batch(cut, self)
+        for funcs, ghdrs in groups.items():
+            self.run_pipeline(funcs, ghdrs)
+        pass
+
+    def pipeline(self, mtype, local):
+        """Compile the ihandlers called for the packets of mtype to me or
+        in transit into a tuple, bypass_handler is always the last. The
+        type is the one a packet arrives with."""
+        funcs = []
+        for func in self.ihandlers[:-1]:
+            types, where = self.hfilters.get(func, (None, None))
+            if types is not None and mtype not in types:
+                continue
+            if where is not None and (where == 'local') != local:
+                continue
+            funcs.append(func)
+        funcs.append(self.ihandlers[-1])
+        funcs = tuple(funcs)
+        self.dispatch[(mtype, local)] = funcs
+        return funcs
+
+    def run_pipeline(self, funcs, hdrs):
+        """Run the ihandlers in funcs over a batch of packets. Each handler
+        sees the whole batch, a packet leaves the batch once a handler
+        returns True for it, so every packet meets the handlers in the
+        same order as before. A handler with a batch entry gets the batch
+        in one call."""
+        for func in funcs:
+            if not hdrs:
+                break
+            bfunc = self.bhandlers.get(func, None)
+            if bfunc is not None:
+                try:
+                    done = bfunc(hdrs, self)
+                    hdrs = [ x for x, d in zip(hdrs, done) if not d ]
+                except Exception, err:
+                    print 'Exception:processor:ihandlers:', self.vrid, err
+                    self.logfh.write("EXCEPT:processor:ihandler:%s\n" % (str(err)))  # Liang: tmp use
+                continue
+            rest = []
+            for msg_hdr in hdrs:
+                done = False
+                try:
+                    done = func(msg_hdr, self)
+                except Exception, err:
+                    print 'Exception:processor:ihandlers:', self.vrid, err
+                    self.logfh.write("EXCEPT:processor:ihandler:%s\n" % (str(err)))  # Liang: tmp use
+                if not done:
+                    rest.append(msg_hdr)
+            hdrs = rest
+        pass
+
     pass
 
 if __name__=="__main__":
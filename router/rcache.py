@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+#
+# This script implements a persistent cache of routing artefacts. The same
+# topology is usually routed again and again in parameter sweeps, so the
+# artefacts are kept on disk, keyed by the hash of the topology file, the
+# routing mode and the version of the routing code.
+#
+# Liang Wang @ Dept. Computer Science, University of Helsinki, Finland
+# 2026.10.18 created.
+#
+
+import os
+import sys
+import time
+import hashlib
+from ctypes import *
+from routing import ROUTING_VERSION
+
+RCACHE_SIZE = 2**30             # Max total size of the cache in bytes
+RCACHE_AGE  = 30 * 24 * 3600    # Max age of an artefact in seconds
+
+class RoutingCache(object):
+    """Content-addressed on-disk cache of routing artefacts. An artefact is
+    a file named <key>-<name>, the key is the hash of the topology file, the
+    routing mode and ROUTING_VERSION. Reading an artefact refreshes its
+    mtime. Eviction scans the whole directory, so it is run once per job
+    by its caller rather than on every put: artefacts older than maxage
+    are evicted first, then the least recently used ones until the cache
+    fits in maxsize bytes."""
+
+    def __init__(self, cachedir, maxsize=RCACHE_SIZE, maxage=RCACHE_AGE):
+        self.cachedir = cachedir
+        self.maxsize = maxsize
+        self.maxage = maxage
+        if not os.path.exists(cachedir):
+            try:
+                os.makedirs(cachedir)
+            except Exception, err:
+                print "Exception:RoutingCache:__init__():", err
+        pass
+
+    def key(self, tfile, mode):
+        """Hash the content of the topology file, the routing mode and the
+        version of the routing code, the artefacts of an older version
+        are never used."""
+        sha1 = hashlib.sha1()
+        fh = open(tfile, 'rb')
+        while True:
+            chunk = fh.read(2**20)
+            if not chunk:
+                break
+            sha1.update(chunk)
+        fh.close()
+        sha1.update('%s-%i' % (mode, ROUTING_VERSION))
+        return sha1.hexdigest()
+
+    def path(self, key, name):
+        """Return the file name of an artefact."""
+        return '%s/%s-%s' % (self.cachedir, key, name)
+
+    def get(self, key, name):
+        """Return the file name of an artefact, None if it is not cached."""
+        fn = self.path(key, name)
+        try:
+            os.utime(fn, None)
+        except OSError:
+            return None
+        return fn
+
+    def put(self, key, name, data):
+        """Save an artefact, the file is replaced atomically."""
+        fn = self.path(key, name)
+        tfn = '%s.%i' % (fn, os.getpid())
+        ofh = open(tfn, 'wb')
+        ofh.write(data)
+        ofh.close()
+        os.rename(tfn, fn)
+        pass
+
+    def evict(self):
+        """Remove the expired artefacts, then the least recently used ones
+        until the cache fits in maxsize."""
+        now = time.time()
+        files = []
+        for x in os.listdir(self.cachedir):
+            fn = '%s/%s' % (self.cachedir, x)
+            try:
+                st = os.stat(fn)
+                if now - st.st_mtime > self.maxage:
+                    os.remove(fn)
+                else:
+                    files.append((st.st_mtime, st.st_size, fn))
+            except OSError:
+                pass
+        total = sum( x[1] for x in files )
+        for mtime, size, fn in sorted(files):
+            if total <= self.maxsize:
+                break
+            try:
+                os.remove(fn)
+            except OSError:
+                pass
+            total -= size
+        pass
+
+    pass
+
+
+def dump_rtable(rtable):
+    """Return the content of a routing table as a string."""
+    return string_at(addressof(rtable), sizeof(rtable))
+
+def load_rtable(ifn, rtable):
+    """Fill in a routing table from a file made of dump_rtable(). Return
+    False if the file does not match the size of the table."""
+    data = open(ifn, 'rb').read()
+    if len(data) != sizeof(rtable):
+        return False
+    memmove(rtable, data, len(data))
+    return True
+
+
+if __name__=="__main__":
+    sys.exit(0)
@@ -0,0 +1,463 @@
+#!/usr/bin/env python
+#
+# This script defines Reactor, the event loop of the reactor engine, and
+# LoopQueue, the router queue consumed by it. With the reactor engine a
+# process runs one loop thread for the listeners, the channel sockets,
+# the timing wheel and the ihandler pipeline of all its routers, instead
+# of a reader and a writer thread per channel plus a processor and an
+# egress thread per router.
+#
+# Liang Wang @ Dept. Computer Science, University of Helsinki, Finland
+# 2026.10.18 created.
+#
+
+import os
+import sys
+import time
+import errno
+import fcntl
+import heapq
+import select
+import thread
+import threading
+from collections import deque
+from Queue import Empty, Full
+
+from fastqueue import FastQueue
+
+LOOP_ROUNDS = 4          # batches a LoopQueue runs before it yields to other events
+LOOP_WAIT   = 0.001      # seconds a LoopQueue or a link waits for room downstream
+
+class Reactor(object):
+    """Readiness-based event loop, on epoll if the platform has it,
+    otherwise on select. Handlers are called in the loop thread: per fd
+    a read and a write handler, timers from call_later, and callbacks
+    from call_soon, which may be called from any thread. Flow control
+    replaces the blocking of the thread engine and is scoped to the
+    queue or output concerned: the packets for a congested output are
+    held by their link, see Link.hold, and while a LoopQueue is over
+    its high-water mark only the inputs feeding it, i.e. the channel
+    sockets of its links, are not read, so TCP pushes back on the
+    remote senders of that queue only."""
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.handlers = {}                 # fd -> (on_readable, on_writable)
+        self.writers = set()               # fds waiting to be writable
+        self.timers = []                   # heap of (time, seq, func)
+        self.ready = deque()               # callbacks to run in the next round
+        self.seq = 0
+        self.ident = None                  # id of the loop thread
+        self.congested = set()             # outputs over their high-water mark
+        self.paused = set()                # queues over their high-water mark
+        self.feeds = {}                    # queue -> fds of the inputs feeding it
+        self.blocked = {}                  # fd -> number of paused queues it feeds
+        self.mutex = threading.Lock()
+        self.epoll = select.epoll() if hasattr(select, 'epoll') else None
+        self.rfd, self.wfd = os.pipe()     # wakes up the loop from other threads
+        for fd in (self.rfd, self.wfd):
+            fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        self.woken = False
+        self.register(self.rfd, self.on_wakeup)
+        pass
+
+    def start(self):
+        """Start the loop thread."""
+        t0 = threading.Thread(target=self.run)
+        t0.daemon = True
+        t0.start()
+        pass
+
+    def in_loop(self):
+        """Whether the caller runs in the loop thread."""
+        return thread.get_ident() == self.ident
+
+    def mask(self, fd):
+        if self.epoll is None:
+            return 0
+        m = select.EPOLLIN
+        if fd in self.blocked:
+            m = 0
+        if fd in self.writers:
+            m |= select.EPOLLOUT
+        return m
+
+    def congest(self, key, flag):
+        """Mark the output key as congested or not."""
+        if flag:
+            self.congested.add(key)
+        else:
+            self.congested.discard(key)
+        pass
+
+    def is_congested(self, key):
+        return key in self.congested
+
+    def feed(self, fd, key):
+        """The input fd feeds the queue key, it is not read while key is
+        paused."""
+        changed = []
+        self.mutex.acquire()
+        fds = self.feeds.setdefault(key, set())
+        if fd not in fds:
+            fds.add(fd)
+            if key in self.paused and self.block(fd, 1):
+                changed.append(fd)
+        self.mutex.release()
+        self.remask(changed)
+        pass
+
+    def pause(self, key, flag):
+        """Mark the queue key as over its high-water mark or not, the
+        inputs feeding it are paused or resumed."""
+        if flag == (key in self.paused):
+            return
+        changed = []
+        self.mutex.acquire()
+        if flag != (key in self.paused):
+            if flag:
+                self.paused.add(key)
+            else:
+                self.paused.discard(key)
+            for fd in self.feeds.get(key, ()):
+                if self.block(fd, 1 if flag else -1):
+                    changed.append(fd)
+        self.mutex.release()
+        self.remask(changed)
+        pass
+
+    def is_paused(self, key):
+        return key in self.paused
+
+    def block(self, fd, n):
+        """Count a paused queue fd feeds more or less, fd is not read
+        while the count is above zero. Return whether that changed, the
+        caller holds the lock."""
+        k = self.blocked.get(fd, 0)
+        if k + n > 0:
+            self.blocked[fd] = k + n
+        else:
+            self.blocked.pop(fd, None)
+        return (k > 0) != (k + n > 0)
+
+    def remask(self, fds):
+        """Apply the read events of fds changed by block()."""
+        if not fds:
+            return
+        if self.epoll is not None:
+            for fd in fds:
+                if fd in self.handlers:
+                    try:
+                        self.epoll.modify(fd, self.mask(fd))
+                    except Exception:
+                        pass
+        if not self.in_loop():
+            self.wakeup()
+        pass
+
+    def register(self, fd, on_readable, on_writable=None):
+        """Watch fd, on_writable is only called after want_write. An fd
+        feeding a queue is not read while the queue is paused, see
+        feed()."""
+        self.mutex.acquire()
+        self.handlers[fd] = (on_readable, on_writable)
+        self.mutex.release()
+        if self.epoll is not None:
+            self.epoll.register(fd, self.mask(fd))
+        self.wakeup()
+        pass
+
+    def unregister(self, fd):
+        self.mutex.acquire()
+        self.handlers.pop(fd, None)
+        self.writers.discard(fd)
+        self.blocked.pop(fd, None)
+        for fds in self.feeds.values():
+            fds.discard(fd)
+        self.mutex.release()
+        if self.epoll is not None:
+            try:
+                self.epoll.unregister(fd)
+            except Exception:
+                pass
+        pass
+
+    def want_write(self, fd, flag):
+        """Turn the write events of fd on or off."""
+        if (fd in self.writers) == flag:
+            return
+        self.mutex.acquire()
+        if flag:
+            self.writers.add(fd)
+        else:
+            self.writers.discard(fd)
+        self.mutex.release()
+        if self.epoll is not None:
+            self.epoll.modify(fd, self.mask(fd))
+        if not self.in_loop():
+            self.wakeup()
+        pass
+
+    def call_soon(self, func, *args):
+        """Run func(*args) in the loop thread, thread-safe."""
+        self.mutex.acquire()
+        self.ready.append((func, args))
+        self.mutex.release()
+        if not self.in_loop():
+            self.wakeup()
+        pass
+
+    def call_later(self, delay, func, *args):
+        """Run func(*args) in the loop thread after delay seconds."""
+        self.mutex.acquire()
+        self.seq += 1
+        heapq.heappush(self.timers, (time.time() + delay, self.seq, func, args))
+        self.mutex.release()
+        if not self.in_loop():
+            self.wakeup()
+        pass
+
+    def wakeup(self):
+        """Interrupt the poll of the loop, once per round."""
+        if self.woken:
+            return
+        self.woken = True
+        try:
+            os.write(self.wfd, 'x')
+        except OSError:
+            pass
+        pass
+
+    def on_wakeup(self):
+        try:
+            while os.read(self.rfd, 4096):
+                pass
+        except OSError:
+            pass
+        pass
+
+    def poll(self, timeout):
+        """Return the ready (fd, readable, writable) triples."""
+        if self.epoll is not None:
+            events = self.epoll.poll(-1 if timeout is None else timeout)
+            return [ (fd, ev & ~select.EPOLLOUT, ev & select.EPOLLOUT) for fd, ev in events ]
+        self.mutex.acquire()
+        rl = [ fd for fd in self.handlers if fd not in self.blocked ]
+        wl = list(self.writers)
+        self.mutex.release()
+        r, w, _ = select.select(rl, wl, [], timeout)
+        w = set(w)
+        events = [ (fd, 1, fd in w) for fd in r ]
+        events.extend([ (fd, 0, 1) for fd in w if fd not in r ])
+        return events
+
+    def run(self):
+        """The loop: poll, handle the ready fds, the due timers and the
+        callbacks. A failing handler is reported and the loop goes on."""
+        self.ident = thread.get_ident()
+        while True:
+            self.woken = False
+            timeout = None
+            if self.ready:
+                timeout = 0
+            elif self.timers:
+                timeout = max(0, self.timers[0][0] - time.time())
+            try:
+                events = self.poll(timeout)
+            except (IOError, OSError, select.error), err:
+                if err.args[0] == errno.EINTR:
+                    continue
+                raise
+            for fd, readable, writable in events:
+                handler = self.handlers.get(fd, None)
+                if handler is None:
+                    continue
+                try:
+                    if readable and fd not in self.blocked:
+                        handler[0]()
+                    if writable and handler[1] is not None and fd in self.handlers:
+                        handler[1]()
+                except Exception, err:
+                    print "Exception:Reactor.run():", err
+
+            now = time.time()
+            due = []
+            self.mutex.acquire()
+            while self.timers and self.timers[0][0] <= now:
+                _, _, func, args = heapq.heappop(self.timers)
+                due.append((func, args))
+            n = len(self.ready)
+            self.mutex.release()
+            # Callbacks added in this round run in the next one
+            for i in range(n):
+                due.append(self.ready.popleft())
+            for func, args in due:
+                try:
+                    func(*args)
+                except Exception, err:
+                    print "Exception:Reactor.run():", err
+        pass
+
+    pass
+
+
+class LoopQueue(FastQueue):
+    """A FastQueue consumed by the reactor. Putting items schedules a
+    run of func over them in batches, each batch first passes the
+    shaper, a batch waits in a timer rather than sleeping. The loop
+    thread never blocks on a full queue, it may fill the queue beyond
+    maxsize, other threads still block. Over half full, the queue
+    pauses the inputs feeding it, so it stays about bounded. While
+    the queue func puts into, downstream, is paused, or an output it
+    feeds is stalled, see stall(), it stops consuming, and fills up
+    in turn."""
+
+    def __init__(self, reactor, func, shaper=None, maxsize=0, batch=64, downstream=None):
+        FastQueue.__init__(self, maxsize)
+        self.reactor = reactor
+        self.func = func
+        self.shaper = shaper
+        self.batch = batch
+        self.downstream = downstream
+        self.held = None                   # batch waiting for the shaper
+        self.scheduled = False
+        self.closed = False                # items put after close() are dropped
+        self.stalls = set()                # outputs over their mark it waits for
+        self.lock = threading.Lock()
+        pass
+
+    def put(self, item, block=True, timeout=None):
+        self.put_many([item], block, timeout)
+        pass
+
+    def put_many(self, items, block=True, timeout=None):
+        if self.closed:
+            return
+        if self.reactor.in_loop():
+            self.extend(items)
+        else:
+            try:
+                FastQueue.put_many(self, items, block, timeout)
+            except Full:
+                self.kick()
+                raise
+        self.queued()
+        pass
+
+    def put_some(self, items):
+        """Like FastQueue.put_some, the loop thread puts all the items."""
+        if self.closed:
+            return 0
+        if self.reactor.in_loop():
+            self.extend(items)
+            n = len(items)
+        else:
+            n = FastQueue.put_some(self, items)
+        self.queued()
+        return n
+
+    def queued(self):
+        """Items were put, pause the inputs if needed and schedule a run."""
+        if self.maxsize > 0 and self.qsize() > self.maxsize // 2:
+            self.reactor.pause(self, True)
+        self.kick()
+        pass
+
+    def kick(self):
+        """Schedule a run unless one is pending."""
+        self.lock.acquire()
+        if self.scheduled:
+            self.lock.release()
+            return
+        self.scheduled = True
+        self.lock.release()
+        self.reactor.call_soon(self.run)
+        pass
+
+    def run(self):
+        """Consume a few batches, then yield to the other events."""
+        if self.closed:
+            return
+        for i in range(LOOP_ROUNDS):
+            if self.stalls:
+                self.lock.acquire()
+                self.scheduled = False
+                self.lock.release()
+                return
+            if self.downstream is not None and self.downstream in self.reactor.paused:
+                self.reactor.call_later(LOOP_WAIT, self.run)
+                return
+            hdrs = self.held
+            if hdrs is None:
+                try:
+                    hdrs = self.get_many(self.batch, False)
+                except Empty:
+                    self.reactor.pause(self, False)
+                    self.lock.acquire()
+                    if self.empty():
+                        self.scheduled = False
+                        self.lock.release()
+                        return
+                    self.lock.release()
+                    continue
+            if self.shaper is not None and self.shaper.enabled:
+                size = sum([ len(x.data) for x in hdrs ])
+                t = self.shaper.wait_time(size)
+                if t > 0:
+                    self.held = hdrs
+                    self.reactor.call_later(t, self.run)
+                    return
+                self.shaper.consume(size)
+            self.held = None
+            try:
+                self.func(hdrs)
+            except Exception, err:
+                print "Exception:LoopQueue.run():", err
+        if self.qsize() < self.maxsize // 4:
+            self.reactor.pause(self, False)
+        self.reactor.call_soon(self.run)
+        pass
+
+    def stall(self, key, flag):
+        """Stop consuming while the output key is over its mark, e.g. a
+        link holding LINK_HOLD packets, resume when no output is. Called
+        in the loop thread."""
+        if flag:
+            self.stalls.add(key)
+        elif key in self.stalls:
+            self.stalls.discard(key)
+            if not self.stalls:
+                self.kick()
+        pass
+
+    def close(self):
+        """Stop consuming, the items left are dropped."""
+        self.closed = True
+        self.held = None
+        with self.mutex:
+            self.queue.clear()
+            self._notify(self.not_full, self.waiters[self.not_full])
+        self.reactor.pause(self, False)
+        pass
+
+    pass
+
+
+_reactor = None
+_reactor_lock = threading.Lock()
+
+def get_reactor():
+    """Return the reactor of this process, start it on first use."""
+    global _reactor
+    _reactor_lock.acquire()
+    try:
+        if _reactor is None or _reactor.pid != os.getpid():
+            _reactor = Reactor()
+            _reactor.start()
+    finally:
+        _reactor_lock.release()
+    return _reactor
+
+
+if __name__=="__main__":
+    sys.exit(0)
@@ -14,13 +14,40 @@ import os
 import sys
 import signal
 import fnmatch
+from Queue import Empty
 from multiprocessing import *
 
 from common import *
 from prouter import *
+from rcache import *
 
 def router_wrapper(args):
     signal.signal(signal.SIGTERM, clean_up)
+    router, mycs, logfh = setup_router(args)
+    start_router(router, args, logfh)
+    monitor_routers([(router, mycs, logfh)])
+    pass
+
+def worker_wrapper(argslist, cmdq=None):
+    """Run many routers in one worker process. All the routers are set
+    up before any of them starts, then the links between them are
+    opened as local links. cmdq brings the commands of the job control,
+    see handle_command()."""
+    signal.signal(signal.SIGTERM, clean_up)
+    routers = []
+    for args in argslist:
+        try:
+            routers.append(setup_router(args))
+        except Exception, err:
+            print 'Exception:router_wrapper:worker_wrapper():', args['vrid'], err
+    for router, mycs, logfh in routers:
+        start_router(router, router.argsdict, logfh)
+    monitor_routers(routers, cmdq)
+    pass
+
+def setup_router(args):
+    """Create a router, build its routing table and hook on the caching
+    strategy and ihandlers. Return (router, cache strategy, log file)."""
     vrid   = args['vrid']
     ip     = args['ip']
     iport  = args['iport']
@@ -34,8 +61,16 @@ def router_wrapper(args):
 
     # Pre-process some parameters
     args['logfh'] = logfh
+    args['l2p'] = dict(args['l2p'])     # the routers of a worker keep their own links in it
     args['ibandwidth'] = float('inf') if args['ibandwidth'] == 0 else args['ibandwidth']
     args['ebandwidth'] = float('inf') if args['ebandwidth'] == 0 else args['ebandwidth']
+    args['burst'] = args.get('burst', 0)
+    args['backlog'] = args.get('backlog', 0)
+    args['coalesce'] = args.get('coalesce', 0)
+    args['transport'] = args.get('transport', 'tcp')
+    args['mtu'] = args.get('mtu', 0)
+    args['engine'] = args.get('engine', 'thread')
+    args['shards'] = args.get('shards', 0)
     if args['queuepolicy'] == 'none':
         args['queuepolicy'] = None
     else:
@@ -47,14 +82,7 @@ def router_wrapper(args):
 
     # Build routing table
     router.read_topology_from_file(tfile)
-    if args['rtable'] == 'otf':
-        router.build_routing_table(router.vrid)
-    elif args['rtable'] == 'sym':
-        router.build_pathdict()
-        router.build_symmetric_routing_table(vrid)
-    elif os.path.exists(args['rtable']):
-        router.pathdict = load_pathdict(args['rtable'])
-        router.build_symmetric_routing_table(vrid)
+    build_routing(router, args)
 
     try:
         # Hook on different cache strategy
@@ -63,31 +91,107 @@ def router_wrapper(args):
         if len(args['ihandler']) > 0:
             sys.path.append(args['ihandler'])
             hook_ihandler(router, args)
+    except Exception, err:
+        logme(logfh, 0, ('prouter_wrapper',0), ('*',0), "EXCEPT", 0, '', str(err))
+
+    return router, mycs, logfh
+
+def start_router(router, args, logfh):
+    """Start the router and its upperapps."""
+    try:
         router.start()
         if args['upperapp'] is not None:
             hook_upperapp(router, args)
     except Exception, err:
         logme(logfh, 0, ('prouter_wrapper',0), ('*',0), "EXCEPT", 0, '', str(err))
+    pass
 
-    bChecked = False
+def monitor_routers(routers, cmdq=None):
+    """Log when the cache of a router becomes full, and the packets
+    its links drop, routers is a list of (router, cache strategy, log
+    file). The commands in cmdq are handled meanwhile."""
+    checked = set()
+    drops = {}
     ts = time.time()
     while True:
         try:
-            time.sleep(0.5)
-            if ( not bChecked and 
-                 mycs is not None and 
-                 mycs.cache.is_full() ):
-                m = int((time.time()-ts)/60)
-                logme2(logfh, 0, ('%im' % (m),0), ('*',0), "FULL", 0, '')
-                bChecked = True
+            if cmdq is None:
+                time.sleep(0.5)
+            else:
+                handle_command(routers, cmdq, 0.5)
+            for router, mycs, logfh in routers:
+                if ( router.vrid not in checked and
+                     mycs is not None and
+                     mycs.cache.is_full() ):
+                    m = int((time.time()-ts)/60)
+                    logme2(logfh, 0, ('%im' % (m),0), ('*',0), "FULL", 0, '')
+                    checked.add(router.vrid)
+                for link in router.links():
+                    if link.drops > drops.get(link, 0):
+                        logme2(logfh, link.drops, (link.ends[1],0), (link.ends[0],0), "DROP", 0, '')
+                        drops[link] = link.drops
         except KeyboardInterrupt:
             break
         except Exception, err:
-            logme(logfh, 0, ('prouter_wrapper',0), ('*',0), "EXCEPT", 1, '', str(err))
+            for router, mycs, logfh in routers:
+                logme(logfh, 0, ('prouter_wrapper',0), ('*',0), "EXCEPT", 1, '', str(err))
             pass
 
     pass
 
+def handle_command(routers, cmdq, timeout):
+    """Wait up to timeout for a command of the job control and run it.
+    ('remove', vrid) stops that router, the other routers of the worker
+    go on."""
+    try:
+        cmd = cmdq.get(True, timeout)
+    except Empty:
+        return
+    if cmd[0] == 'remove':
+        for x in list(routers):
+            router, mycs, logfh = x
+            if router.vrid == cmd[1]:
+                router.stop()
+                routers.remove(x)
+                logfh.close()
+    pass
+
+def build_routing(router, args):
+    """Build the routing table according to the rtable option. For 'otf'
+    and 'sym', the routing cache is checked first if there is one."""
+    vrid = args['vrid']
+    mode = args['rtable']
+    rcache = None
+    if args.get('rcache', '') and mode in ['otf', 'sym']:
+        rcache = RoutingCache(args['rcache'])
+        rkey = rcache.key(args['tfile'], mode)
+        rname = 'rtable-%i' % vrid
+        fn = rcache.get(rkey, 'pathstore')
+        if fn is not None:
+            router.load_routing_file(fn)
+            return
+        fn = rcache.get(rkey, rname)
+        if fn is not None and load_rtable(fn, router.rtable):
+            if mode == 'sym':
+                router.pathdict = SymmetricPaths(router.adj)
+            return
+
+    if mode == 'otf':
+        router.build_routing_table(vrid)
+    elif mode == 'lazy':
+        router.enable_lazy_routing()
+    elif mode == 'sym':
+        router.build_symmetric_routing_table(vrid)
+    elif os.path.exists(mode) and is_rtable_file(mode):
+        router.load_routing_file(mode)
+    elif os.path.exists(mode):
+        router.pathdict = load_pathdict(mode)
+        router.build_symmetric_routing_table(vrid)
+
+    if rcache is not None:
+        rcache.put(rkey, rname, dump_rtable(router.rtable))
+    pass
+
 def hook_cache(router, cstg, cssz, crpl, logfh):
     """Hook on different cache strategy"""
     mycs = None
@@ -99,7 +203,11 @@ def hook_cache(router, cstg, cssz, crpl, logfh):
     # Hook on different admission & cooperative model: lru, cachedbit,
     # pcachedbit, pushcache, nbsearch, mhnbsearch, mfr, pushprob, smartre
     exec('mycs = %s(router, %i)' % (cstg, cssz))
-    router.register_ihandler(mycs.ihandler)
+    router.register_ihandler(mycs.ihandler, getattr(mycs, 'ihandler_batch', None),
+                             getattr(mycs, 'ihandler_lazy', False),
+                             getattr(mycs, 'ihandler_types', None),
+                             getattr(mycs, 'ihandler_where', None),
+                             getattr(mycs, 'ihandler_shardable', True))
 
     # Hook on different replacement model: lru, lfu, lfuda, fifobucket
     exec('mycs.cache = cache_%s(%i)' % (crpl, cssz))
@@ -116,21 +224,31 @@ def hook_ihandler(router, args):
     for ih in ihs:
         try:
             ih = ih[:-3]
-            exec("from %s import ihandler" % ih)
-            router.register_ihandler(ihandler)
+            exec("import %s as ihm" % ih)
+            router.register_ihandler(ihm.ihandler, getattr(ihm, 'ihandler_batch', None),
+                                     getattr(ihm, 'ihandler_lazy', False),
+                                     getattr(ihm, 'ihandler_types', None),
+                                     getattr(ihm, 'ihandler_where', None),
+                                     getattr(ihm, 'ihandler_shardable', True))
         except Exception, err:
             print 'Exception:router_wrapper:hook_ihandler():', err
     pass
 
 def hook_upperapp(router, args):
-    """Start all the upperapp if there is any on this router"""
+    """Start all the upperapp if there is any on this router. An app
+    setting FLOW_ROUTES changes the routes of single flows, the per-flow
+    next hops are created before it is forked."""
     for app, app_args in args['upperapp']:
         try:
-            exec('from %s import main' % app)
+            exec('import %s as appm' % app)
+            main = appm.main
+            if getattr(appm, 'FLOW_ROUTES', False) and router.frtable is None:
+                router.enable_flow_routes()
             args['app_args'] = app_args
             p = Process(target=main, args=(router, args,))
             p.daemon = True
             p.start()
+            router.procs.append(p)
         except Exception, err:
             print 'Exception:router_wrapper:hook_upperapp():', err
     pass
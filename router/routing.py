@@ -0,0 +1,420 @@
+#!/usr/bin/env python
+#
+# This script contains the routing algorithms used by prouter. The all-pairs
+# routing is a matrix of symmetric shortest path trees, one row per router,
+# see PathStore, a router is referred by its position in the sorted router
+# list instead of its vrid.
+#
+# Liang Wang @ Dept. Computer Science, University of Helsinki, Finland
+# 2026.10.18 created.
+#
+
+import os
+import re
+import sys
+import mmap
+import array
+import heapq
+import itertools
+import struct
+from multiprocessing import Pool
+
+INF = float('Inf')
+_adj     = None     # Set by PathStore.build() for the worker processes
+_links   = None
+_routers = None
+PS_MAGIC   = 'LLPS'
+PS_VERSION = 1
+ROUTING_VERSION = 2                   # bumped when the paths chosen or a saved layout change
+PS_HEADER  = struct.Struct('=4sII')   # magic, version, number of routers
+PS_INT32   = struct.Struct('=i')
+PS_INT16   = struct.Struct('=h')
+
+def read_topology(fn):
+    """Read the overlay topology from a file. Return the router set and
+    a dict contains all the links and link properties."""
+    routers = set()
+    topology = {}
+    for line in open(fn, 'r').readlines():
+        line = line.strip()
+        if line.startswith('#'):
+            continue
+        m = re.search(r"(\d+)\s*->\s*(\d+)\s*(\d*)\s*(\d*)\s*([.\d]*)\s*([.\d]*)", line).groups()
+        vr1 = int(m[0])
+        vr2 = int(m[1])
+        weight = int(m[2]) if len(m[2]) else 1
+        bandwidth = int(m[3]) if len(m[3]) and m[3] != '0' else float('Inf')
+        delay = float(m[4]) if len(m[4]) else 0
+        lossrate = float(m[5]) if len(m[5]) else 0
+        routers.add(vr1)
+        routers.add(vr2)
+        link = tuple(sorted([vr1,vr2]))
+        topology[link] = {'weight':weight, 'bandwidth':bandwidth,
+                          'delay':delay, 'lossrate':lossrate}
+    return routers, topology
+
+def build_adjacency(topology):
+    """Index the links by vertex, adj[x][y] is the weight of link x-y."""
+    adj = {}
+    for (x, y), p in topology.items():
+        adj.setdefault(x, {})[y] = p['weight']
+        adj.setdefault(y, {})[x] = p['weight']
+    return adj
+
+def dijkstra(adj, src):
+    """Use Dijkstra algorithm with a binary heap to find the shortest
+    paths from src. Return the distance and the previous hop of every
+    reachable node. Among equal distances the smaller vrid is settled
+    first, as in the original min() based version."""
+    dist = {src: 0}
+    prev = {src: None}
+    done = set()
+    heap = [(0, src)]
+    while heap:
+        d, m = heapq.heappop(heap)
+        if m in done:
+            continue
+        done.add(m)
+        for n, w in adj.get(m, {}).items():
+            alt = d + w
+            if alt < dist.get(n, INF):
+                dist[n] = alt
+                prev[n] = m
+                heapq.heappush(heap, (alt, n))
+    return dist, prev
+
+def link_index(adj):
+    """Number the links of adj in the order of their sorted ends,
+    index[x][y] is the number of link x-y."""
+    links = sorted(set( (min(x, y), max(x, y)) for x in adj for y in adj[x] ))
+    index = {}
+    for i, (x, y) in enumerate(links):
+        index.setdefault(x, {})[y] = i
+        index.setdefault(y, {})[x] = i
+    return index
+
+def symmetric_dijkstra(adj, src, links=None):
+    """Dijkstra variant whose paths are symmetric, i.e. the path from x to y
+    is exactly the reverse of the path from y to x. Equal-cost paths are
+    ordered by hop count, then by their set of links as a bit mask, link i
+    of link_index() being bit i. A path and its reverse have the same mask,
+    two different paths never do, and the masks add up along a path, so the
+    shortest path between two routers is unique, its subpaths are shortest
+    as well and every router computing only its own row agrees with all
+    the others. The mask of a router is built once it is settled, from the
+    mask of its predecessor, and only compared on an exact tie of distance
+    and hops. A mask is a long of up to E bits, so building the masks
+    takes O(V E / w) time and memory on top of the O(E log V) of Dijkstra,
+    w being the bits of a machine word, and a tie costs O(E / w)."""
+    if links is None:
+        links = link_index(adj)
+    key = {src: (0, 0)}
+    prev = {src: None}
+    mask = {}
+    heap = [(0, 0, src)]
+    while heap:
+        d, h, m = heapq.heappop(heap)
+        if m in mask:
+            continue
+        p = prev[m]
+        mask[m] = mask[p] | 1 << links[p][m] if p is not None else 0
+        for n, w in adj.get(m, {}).items():
+            if n in mask:
+                continue
+            alt = (d + w, h + 1)
+            old = key.get(n, None)
+            if old is None or alt < old:
+                key[n] = alt
+                prev[n] = m
+                heapq.heappush(heap, alt + (n,))
+            elif alt == old:
+                p = prev[n]
+                if mask[m] | 1 << links[m][n] < mask[p] | 1 << links[p][n]:
+                    prev[n] = m
+    dist = dict( (x, k[0]) for x, k in key.items() )
+    return dist, prev
+
+def bidirectional_dijkstra(adj, src, dst):
+    """Search the shortest path from src to dst from both ends at the same
+    time. Only the balls around src and dst are explored instead of the
+    whole graph. Return the path, None if dst is unreachable."""
+    if src == dst:
+        return [src]
+    dist = [{src: 0}, {dst: 0}]
+    prev = [{src: None}, {dst: None}]
+    done = [set(), set()]
+    heap = [[(0, src)], [(0, dst)]]
+    best, meet = INF, None
+    while heap[0] and heap[1]:
+        if heap[0][0][0] + heap[1][0][0] >= best:
+            break
+        d = 0 if heap[0][0][0] <= heap[1][0][0] else 1
+        du, u = heapq.heappop(heap[d])
+        if u in done[d]:
+            continue
+        done[d].add(u)
+        for v, w in adj.get(u, {}).items():
+            alt = du + w
+            if alt < dist[d].get(v, INF):
+                dist[d][v] = alt
+                prev[d][v] = u
+                heapq.heappush(heap[d], (alt, v))
+            if v in dist[1 - d] and dist[d][v] + dist[1 - d][v] < best:
+                best = dist[d][v] + dist[1 - d][v]
+                meet = v
+    if meet is None:
+        return None
+    path = [meet]
+    while prev[0][path[-1]] is not None:
+        path.append(prev[0][path[-1]])
+    path.reverse()
+    while prev[1][path[-1]] is not None:
+        path.append(prev[1][path[-1]])
+    return path
+
+def first_hops(prev, src):
+    """Given the previous hops from dijkstra(), return the first hop from
+    src to every reachable node."""
+    first = {src: src}
+    for x in prev:
+        path = []
+        while x not in first:
+            path.append(x)
+            if prev[x] == src:
+                first[x] = x
+                break
+            x = prev[x]
+        for y in path:
+            first[y] = first[x]
+    return first
+
+def compute_rtable_file(tfile, ofn, nproc=None):
+    """Compute the symmetric routing of a topology once, and save it as a
+    PathStore file. The rows are computed in parallel on nproc cores."""
+    routers, topology = read_topology(tfile)
+    store = PathStore.build(build_adjacency(topology), nproc)
+    store.save(ofn)
+    pass
+
+def is_rtable_file(ifn):
+    """Check whether a file is a saved PathStore."""
+    fh = open(ifn, 'rb')
+    magic = fh.read(len(PS_MAGIC))
+    fh.close()
+    return magic == PS_MAGIC
+
+def symmetric_row(src):
+    """Return the predecessor row and hop row of src in the symmetric tree,
+    packed in the PathStore layout. Uses the adj and routers set by
+    PathStore.build()."""
+    dist, prev = symmetric_dijkstra(_adj, src, _links)
+    hops = {src: 0}
+    for x in prev:
+        path = []
+        while x not in hops:
+            path.append(x)
+            x = prev[x]
+        for y in reversed(path):
+            hops[y] = hops[x] + 1
+            x = y
+    prev[src] = -1
+    pred = array.array('i', [ prev.get(x, -1) for x in _routers ])
+    hops = array.array('h', [ hops.get(x, -1) for x in _routers ])
+    return pred.tostring(), hops.tostring()
+
+
+class PathDict(object):
+    """The dict protocol of a pathdict, keyed by (src, dst) and built on
+    get_path(). A path from a router to itself is not kept."""
+
+    def __getitem__(self, key):
+        path = self.get_path(*key) if key[0] != key[1] else None
+        if path is None:
+            raise KeyError(key)
+        return path
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def has_key(self, key):
+        return key in self
+
+    pass
+
+
+class PathStore(PathDict):
+    """Compact pathdict made of an int32 predecessor matrix and an int16
+    hop-count matrix. pred[i][j] is the vrid before j on the path from i to
+    j; hops[i][j] is the path length in hops, -1 means unreachable. Paths
+    are reconstructed on demand. Both matrices live in one buffer with the
+    same layout as the file, so a saved store is mmap-ed as it is: only the
+    pages actually used are read, and they are shared by all the router
+    processes on a node. The paths are the symmetric ones, so the next hop
+    from i to j is simply pred[j][i]."""
+
+    def __init__(self, buf):
+        magic, version, n = PS_HEADER.unpack_from(buf, 0)
+        if magic != PS_MAGIC or version != PS_VERSION:
+            raise Exception("PathStore: unknown format")
+        self.buf = buf
+        self.n = n
+        vsize = PS_INT32.size * n
+        self.pred_offset = PS_HEADER.size + vsize
+        self.hops_offset = self.pred_offset + vsize * n
+        self.routers = array.array('i', str(buf[PS_HEADER.size:self.pred_offset]))
+        self.rindex = dict( (x, i) for i, x in enumerate(self.routers) )
+        pass
+
+    @classmethod
+    def build(cls, adj, nproc=1):
+        """Compute the symmetric tree of every router, in parallel on nproc
+        cores, None means all of them."""
+        global _adj, _links, _routers
+        _adj = adj
+        _links = link_index(adj)
+        _routers = sorted(adj)
+        n = len(_routers)
+        vsize = PS_INT32.size * n
+        buf = bytearray(PS_HEADER.size + vsize + (PS_INT32.size + PS_INT16.size) * n * n)
+        PS_HEADER.pack_into(buf, 0, PS_MAGIC, PS_VERSION, n)
+        buf[PS_HEADER.size:PS_HEADER.size + vsize] = array.array('i', _routers).tostring()
+
+        pool = Pool(nproc) if nproc != 1 else None
+        rows = pool.imap(symmetric_row, _routers, 16) if pool else itertools.imap(symmetric_row, _routers)
+        pred_offset = PS_HEADER.size + vsize
+        hops_offset = pred_offset + vsize * n
+        for i, (pred, hops) in enumerate(rows):
+            start = pred_offset + i * len(pred)
+            buf[start:start + len(pred)] = pred
+            start = hops_offset + i * len(hops)
+            buf[start:start + len(hops)] = hops
+        if pool:
+            pool.close()
+            pool.join()
+        return cls(buf)
+
+    @classmethod
+    def load(cls, ifn):
+        """Map a saved store into memory."""
+        fh = open(ifn, 'rb')
+        mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        fh.close()
+        return cls(mm)
+
+    def save(self, ofn):
+        """Save the store, the file is replaced atomically."""
+        tfn = '%s.%i' % (ofn, os.getpid())
+        ofh = open(tfn, 'wb')
+        ofh.write(self.buf)
+        ofh.close()
+        os.rename(tfn, ofn)
+        pass
+
+    def pred(self, src, dst):
+        """Return the vrid before dst on the path from src to dst."""
+        pos = self.pred_offset + (self.rindex[src] * self.n + self.rindex[dst]) * PS_INT32.size
+        return PS_INT32.unpack_from(self.buf, pos)[0]
+
+    def hops(self, src, dst):
+        """Return the length of the path from src to dst in hops."""
+        pos = self.hops_offset + (self.rindex[src] * self.n + self.rindex[dst]) * PS_INT16.size
+        return PS_INT16.unpack_from(self.buf, pos)[0]
+
+    def next_hop(self, src, dst):
+        """Return the next hop from src to dst, -1 means unreachable."""
+        return self.pred(dst, src)
+
+    def pred_row(self, src):
+        """Return the predecessors on the paths from src, as an array in
+        the order of routers."""
+        start = self.pred_offset + self.rindex[src] * self.n * PS_INT32.size
+        return array.array('i', str(self.buf[start:start + self.n * PS_INT32.size]))
+
+    def load_row(self, vrid, rtable):
+        """Fill in a router's rtable with its next hops. They are derived
+        from its own row, each router's predecessor is followed back to
+        the first hop, which is kept for the routers behind it."""
+        pred = dict(itertools.izip(self.routers, self.pred_row(vrid)))
+        first = {vrid: -1}
+        for dst in self.routers:
+            path = []
+            x = dst
+            while x not in first:
+                path.append(x)
+                p = pred[x]
+                if p == vrid:
+                    first[x] = x
+                    break
+                if p < 0:
+                    first[x] = -1
+                    break
+                x = p
+            for y in path:
+                first[y] = first[x]
+            rtable[dst] = first[dst]
+        pass
+
+    def get_path(self, src, dst):
+        """Return the path from src to dst, None if unreachable."""
+        h = self.hops(src, dst)
+        if h < 0:
+            return None
+        path = [dst] * (h + 1)
+        for i in range(h - 1, -1, -1):
+            path[i] = self.pred(src, path[i + 1])
+        return path
+
+    def __len__(self):
+        return self.n * (self.n - 1)
+
+    pass
+
+
+class SymmetricPaths(PathDict):
+    """A pathdict computing the symmetric paths on demand. The shortest
+    path tree of a source is built on its first lookup and kept, a path
+    can also be served reversed from the tree of its destination."""
+
+    def __init__(self, adj):
+        self.adj = adj
+        self.links = link_index(adj)
+        self.trees = {}
+        pass
+
+    def tree(self, src):
+        """Return the previous hops in the symmetric tree of src."""
+        prev = self.trees.get(src, None)
+        if prev is None:
+            dist, prev = symmetric_dijkstra(self.adj, src, self.links)
+            self.trees[src] = prev
+        return prev
+
+    def get_path(self, src, dst):
+        """Return the path from src to dst, None if unreachable."""
+        if src not in self.trees and dst in self.trees:
+            path = self.get_path(dst, src)
+            return path[::-1] if path is not None else None
+        prev = self.tree(src)
+        if dst not in prev:
+            return None
+        path = [dst]
+        while path[-1] != src:
+            path.append(prev[path[-1]])
+        path.reverse()
+        return path
+
+    def __len__(self):
+        n = len(self.adj)
+        return n * (n - 1)
+
+    pass
+
+
+if __name__=="__main__":
+    sys.exit(0)
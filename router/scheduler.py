@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+#
+# This script defines TimingWheel, the scheduler that owns all the
+# delayed deliveries in a process. All the links in the process share
+# one wheel and one timer thread, scheduling a packet costs O(1) no
+# matter how many links there are, and due packets are handed over in
+# batches at tick granularity. The wheel wakes up at the next expiry
+# only. With the reactor engine the wheel has no thread, the reactor
+# advances it with a timer while entries are pending.
+#
+# Liang Wang @ Dept. Computer Science, University of Helsinki, Finland
+# 2026.10.18 created.
+#
+
+import os
+import sys
+import math
+import time
+import threading
+
+TICK   = 0.001           # tick length of the wheel in seconds
+BITS   = 8               # each level has 2**BITS slots
+LEVELS = 4               # 2**32 ticks, about 50 days with 1ms tick
+
+class TimingWheel(object):
+    """Hierarchical timing wheel. Level 0 slots are one tick long, the
+    slots of each higher level cover a whole turn of the level below.
+    An entry lives in the lowest level that covers its expiry, and is
+    cascaded down as time goes by. Entries are (queue, item) pairs, the
+    items due in a tick are delivered with queue.put_some in the order
+    they were scheduled."""
+
+    def __init__(self, tick=TICK, bits=BITS, levels=LEVELS):
+        self.tick = tick
+        self.bits = bits
+        self.mask = (1 << bits) - 1
+        self.levels = levels
+        self.wheels = [ [ [] for i in range(1 << bits) ] for j in range(levels) ]
+        self.current = int(time.time() / tick)
+        self.count = 0
+        self.deadline = None               # tick the driver wakes up at, None if not armed
+        self.pid = os.getpid()
+        self.mutex = threading.Lock()
+        self.not_empty = threading.Condition(self.mutex)
+        self.thread = None
+        self.reactor = None
+        pass
+
+    def start(self, reactor=None):
+        """Start the timer thread, or let the reactor drive the wheel."""
+        if reactor is not None:
+            self.reactor = reactor
+            return
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+        pass
+
+    def insert(self, expire, entry):
+        """Put an entry in its slot, the caller holds the lock."""
+        delta = expire - self.current
+        if delta < 0:
+            expire = self.current
+            delta = 0
+        for level in range(self.levels):
+            if delta >> (self.bits * (level + 1)) == 0:
+                break
+        else:
+            expire = self.current + (1 << (self.bits * self.levels)) - 1
+        idx = (expire >> (self.bits * level)) & self.mask
+        self.wheels[level][idx].append((expire, entry))
+        pass
+
+    def schedule(self, t, queue, item):
+        """Deliver item into queue at time t, never earlier."""
+        expire = int(math.ceil(t / self.tick))
+        self.mutex.acquire()
+        try:
+            if self.count == 0:
+                # The wheel is idle, catch up with the clock first
+                self.current = int(time.time() / self.tick)
+            # The slot of the current tick is already fired
+            expire = max(expire, self.current + 1)
+            self.insert(expire, (queue, item))
+            self.count += 1
+            if self.deadline is None or expire < self.deadline:
+                self.wake(expire)
+        finally:
+            self.mutex.release()
+        pass
+
+    def wake(self, expire):
+        """Make the driver wake up at the tick expire. The caller holds
+        the lock."""
+        self.deadline = expire
+        if self.reactor is not None:
+            self.reactor.call_later(max(0, expire * self.tick - time.time()), self.poll, expire)
+        else:
+            self.not_empty.notify()
+        pass
+
+    def next_expiry(self):
+        """Return the tick of the first entry of level 0, but no later
+        than the next cascade. The caller holds the lock."""
+        slots = self.wheels[0]
+        cascade = ((self.current >> self.bits) + 1) << self.bits
+        for t in xrange(self.current + 1, cascade):
+            if slots[t & self.mask]:
+                return t
+        return cascade
+
+    def advance(self, target):
+        """Move the wheel up to the tick target, return the due entries
+        in the order of their expiry. The caller holds the lock."""
+        due = []
+        while self.current < target:
+            self.current += 1
+            # Cascade the higher levels when the level below wraps
+            for level in range(1, self.levels):
+                if (self.current >> (self.bits * (level - 1))) & self.mask:
+                    break
+                idx = (self.current >> (self.bits * level)) & self.mask
+                slot = self.wheels[level][idx]
+                self.wheels[level][idx] = []
+                for expire, entry in slot:
+                    self.insert(expire, entry)
+            idx = self.current & self.mask
+            slot = self.wheels[0][idx]
+            if slot:
+                self.wheels[0][idx] = []
+                due.extend([ entry for expire, entry in slot ])
+        self.count -= len(due)
+        return due
+
+    def run(self):
+        """Timer thread, it sleeps until the next expiry, or until an
+        entry is scheduled when nothing is pending. schedule() wakes it
+        up earlier for an entry expiring before."""
+        while True:
+            self.mutex.acquire()
+            try:
+                while True:
+                    self.deadline = None
+                    due = self.advance(int(time.time() / self.tick))
+                    if due:
+                        break
+                    if self.count == 0:
+                        self.not_empty.wait()
+                        continue
+                    self.deadline = self.next_expiry()
+                    self.not_empty.wait(max(0, self.deadline * self.tick - time.time()))
+            finally:
+                self.mutex.release()
+            self.fire(due)
+        pass
+
+    def poll(self, expire):
+        """Reactor timer, fire the due entries and wake up again at the
+        next expiry while entries are pending. A timer overtaken by an
+        earlier one does nothing."""
+        self.mutex.acquire()
+        try:
+            if expire != self.deadline:
+                return
+            self.deadline = None
+            due = self.advance(int(time.time() / self.tick))
+            if self.count > 0:
+                self.wake(self.next_expiry())
+        finally:
+            self.mutex.release()
+
+        if due:
+            self.fire(due)
+        pass
+
+    def fire(self, due):
+        """Deliver a batch of due entries, one put_some per queue. The
+        timer is shared by all the links of the process and must not
+        wait for a full queue, the items it has no room for are dropped
+        like the packets beyond the backlog of a link."""
+        batch = {}
+        order = []
+        for queue, item in due:
+            if queue not in batch:
+                batch[queue] = []
+                order.append(queue)
+            batch[queue].append(item)
+        for queue in order:
+            items = batch[queue]
+            try:
+                queue.put_some(items)
+            except Exception, err:
+                print "Exception:TimingWheel.fire():", err
+        pass
+
+    pass
+
+
+_wheel = None
+_wheel_lock = threading.Lock()
+
+def get_scheduler(reactor=None):
+    """Return the timing wheel of this process, start it on first use.
+    If the first caller passes a reactor, the reactor drives the wheel."""
+    global _wheel
+    _wheel_lock.acquire()
+    try:
+        if _wheel is None or _wheel.pid != os.getpid():
+            _wheel = TimingWheel()
+            _wheel.start(reactor)
+    finally:
+        _wheel_lock.release()
+    return _wheel
+
+
+if __name__=="__main__":
+    sys.exit(0)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+#
+# This script defines TokenBucket, the traffic shaper shared by the
+# routers and the links. Instead of counting bytes in a one-second
+# window and polling the clock, the bucket computes the exact time
+# needed until enough tokens exist, and sleeps once.
+#
+# Liang Wang @ Dept. Computer Science, University of Helsinki, Finland
+# 2026.10.18 created.
+#
+
+import os
+import sys
+import time
+
+BURST_TIME = 0.01        # default burst is the traffic of 10ms at full rate
+
+class TokenBucket(object):
+    """Token bucket shaper. rate is in bytes per second, zero or inf
+    means no shaping. burst is the bucket depth in bytes, zero means the
+    default BURST_TIME worth of traffic. A bucket is meant to be used by
+    a single thread, there is no lock inside."""
+
+    def __init__(self, rate, burst=0):
+        self.rate = float(rate) if rate else float('inf')
+        self.enabled = self.rate != float('inf')
+        self.burst = float(burst) if burst > 0 else self.rate * BURST_TIME
+        self.tokens = self.burst
+        self.last = time.time()
+        pass
+
+    def refill(self):
+        """Add the tokens accumulated since the last call."""
+        now = time.time()
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        pass
+
+    def wait_time(self, size):
+        """Return the time in seconds until size bytes can be sent."""
+        if not self.enabled:
+            return 0.0
+        self.refill()
+        lack = min(size, self.burst) - self.tokens
+        return lack / self.rate if lack > 0 else 0.0
+
+    def consume(self, size):
+        """Take size bytes from the bucket, block until they are
+        available. A packet bigger than the bucket drives the tokens
+        negative, the debt is paid by the following packets, so the
+        long-term rate holds for any packet size."""
+        if not self.enabled:
+            return
+        t = self.wait_time(size)
+        if t > 0:
+            time.sleep(t)
+            self.refill()
+        self.tokens -= size
+        pass
+
+    pass
+
+
+if __name__=="__main__":
+    sys.exit(0)
@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+#
+# This script defines ShmRing, a single-producer single-consumer ring
+# buffer in shared memory. Links between co-located routers carry their
+# packets over a pair of rings instead of the loopback TCP connection,
+# a packet is copied once into the ring and once out of it. A side going
+# to sleep, the consumer on an empty ring or the producer on a full one,
+# sets its flag and checks the ring once more under a file lock, the
+# other side reads the flag under the same lock, so no wakeup is lost.
+#
+# Liang Wang @ Dept. Computer Science, University of Helsinki, Finland
+# 2026.10.18 created.
+#
+
+import os
+import sys
+import mmap
+import random
+import fcntl
+import struct
+import tempfile
+from ctypes import *
+
+from messageheader import *
+
+SHM_DIR  = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+SHM_RING = 2**20         # max data bytes of a ring, a packet over half of it goes via TCP
+SHM_MIN  = 2**17         # min data bytes of a ring
+SHM_WRAP = 0xffffffff    # record length marking the rest of the ring as unused
+
+# The control words live in separate cache lines, head is written by the
+# consumer only, tail and the packets by the producer only. They are
+# accessed through ctypes, a single load or store each, pack_into would
+# zero a word before writing it and the other side could read the zero.
+HEAD_OFF = 0
+TAIL_OFF = 64
+WAIT_OFF = 128
+FULL_OFF = 136
+DATA_OFF = 192
+RLEN     = struct.Struct('=I')
+
+def ring_size(bandwidth, backlog):
+    """Return the data bytes of a ring for a link, enough for the packets
+    the link can have in its serialization backlog, rounded up to a power
+    of 2 between SHM_MIN and SHM_RING."""
+    size = SHM_MIN
+    while size < min(bandwidth * backlog, SHM_RING):
+        size *= 2
+    return size
+
+class ShmRing(object):
+    """A ring of length-prefixed packets in a mmap-ed file. waiting is
+    set by the consumer before it goes to sleep, the producer then rings
+    the doorbell after its next push. full is set by the producer before
+    it waits for room, the consumer then tells it after its next pop. The
+    file stays open for the lock, see sleep() and wake()."""
+
+    def __init__(self, path, size=SHM_RING, create=False):
+        self.path = path
+        self.fd = os.open(path, os.O_RDWR | (os.O_CREAT | os.O_EXCL if create else 0), 0600)
+        if create:
+            os.ftruncate(self.fd, DATA_OFF + size)
+        else:
+            size = os.fstat(self.fd).st_size - DATA_OFF
+        self.size = size
+        self.mm = mmap.mmap(self.fd, DATA_OFF + size)
+        self.base = addressof(c_char.from_buffer(self.mm))
+        self.headp = c_uint64.from_buffer(self.mm, HEAD_OFF)
+        self.tailp = c_uint64.from_buffer(self.mm, TAIL_OFF)
+        self.waitp = c_uint64.from_buffer(self.mm, WAIT_OFF)
+        self.fullp = c_uint64.from_buffer(self.mm, FULL_OFF)
+        self.head = self.headp.value
+        self.tail = self.tailp.value
+        self.seen = self.head              # head seen by the last push that failed
+        if create:
+            self.waiting = True
+        pass
+
+    @classmethod
+    def create(cls, name, size=SHM_RING):
+        """Create a new ring with a unique file name."""
+        path = '%s/litelab-%s-%i-%08x' % (SHM_DIR, name, os.getpid(), random.getrandbits(32))
+        return cls(path, size, True)
+
+    def close(self):
+        """Remove the file and release the lock file descriptor, the
+        mapping stays valid."""
+        self.unlink()
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        pass
+
+    def unlink(self):
+        """Remove the file, the mapping stays valid."""
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+        pass
+
+    @property
+    def waiting(self):
+        return self.waitp.value != 0
+
+    @waiting.setter
+    def waiting(self, val):
+        self.waitp.value = 1 if val else 0
+
+    def lock(self):
+        fcntl.lockf(self.fd, fcntl.LOCK_EX, 1, 0)
+        pass
+
+    def unlock(self):
+        fcntl.lockf(self.fd, fcntl.LOCK_UN, 1, 0)
+        pass
+
+    def sleep(self):
+        """Consumer: set waiting before going to sleep. Return False, with
+        waiting unset, if the producer has pushed in the meantime."""
+        self.lock()
+        try:
+            self.waiting = self.tailp.value == self.head
+            return self.waiting
+        finally:
+            self.unlock()
+
+    def wake(self):
+        """Producer: whether the consumer sleeps, waiting is unset then and
+        the caller rings the doorbell."""
+        self.lock()
+        try:
+            waiting = self.waiting
+            if waiting:
+                self.waiting = False
+            return waiting
+        finally:
+            self.unlock()
+
+    def block(self):
+        """Producer: set full before waiting for room, after a push has
+        failed. Return False, with full unset, if the consumer has popped
+        in the meantime."""
+        self.lock()
+        try:
+            full = self.headp.value == self.seen
+            self.fullp.value = 1 if full else 0
+            return full
+        finally:
+            self.unlock()
+
+    def unblock(self):
+        """Consumer: whether the producer waits for room, full is unset
+        then and the caller tells it."""
+        self.lock()
+        try:
+            full = self.fullp.value != 0
+            if full:
+                self.fullp.value = 0
+            return full
+        finally:
+            self.unlock()
+
+    def push(self, msg_hdr):
+        """Producer: append a packet, return False if the ring is full."""
+        wire = msg_hdr.pack()
+        hlen = len(wire)
+        n = RLEN.size + hlen + len(msg_hdr.data)
+        n = (n + 7) & ~7
+        pos = self.tail % self.size
+        pad = self.size - pos if pos + n > self.size else 0
+        head = self.headp.value
+        if self.size - (self.tail - head) < pad + n:
+            self.seen = head
+            return False
+        if pad:
+            RLEN.pack_into(self.mm, DATA_OFF + pos, SHM_WRAP)
+            pos = 0
+        addr = self.base + DATA_OFF + pos
+        RLEN.pack_into(self.mm, DATA_OFF + pos, hlen + len(msg_hdr.data))
+        memmove(addr + RLEN.size, wire, hlen)
+        memmove(addr + RLEN.size + hlen, msg_hdr.data, len(msg_hdr.data))
+        self.tail += pad + n
+        self.tailp.value = self.tail
+        return True
+
+    def pop(self, lazy=False):
+        """Consumer: take the oldest packet, None if the ring is empty.
+        If lazy, the header is a LazyHeader."""
+        tail = self.tailp.value
+        if self.head == tail:
+            return None
+        pos = self.head % self.size
+        length = RLEN.unpack_from(self.mm, DATA_OFF + pos)[0]
+        if length == SHM_WRAP:
+            self.head += self.size - pos
+            pos = 0
+            length = RLEN.unpack_from(self.mm, DATA_OFF)[0]
+        off = DATA_OFF + pos + RLEN.size
+        msg_hdr = blank_header()
+        if lazy:
+            hlen = header_len(self.mm, off)
+            msg_hdr.wrap(self.mm[off:off + hlen])
+        else:
+            hlen = msg_hdr.unpack_from(self.mm, off)
+        msg_hdr.data = string_at(self.base + off + hlen, length - hlen)
+        self.head += (RLEN.size + length + 7) & ~7
+        self.headp.value = self.head
+        return msg_hdr
+
+    def fits(self, msg_hdr):
+        """Whether the packet can always go through the ring. A record
+        may need the padding at the end of the ring plus its own length,
+        so it must not be bigger than half of the ring."""
+        return 2 * (RLEN.size + HEADER_MAX + len(msg_hdr.data) + 7) <= self.size
+
+    pass
+
+
+if __name__=="__main__":
+    sys.exit(0)
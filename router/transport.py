@@ -0,0 +1,517 @@
+#!/usr/bin/env python
+#
+# This script defines Transport and Channel. A Channel is one TCP
+# connection between two processes, it carries all the virtual links
+# between the routers on both ends. Every frame is tagged with the
+# (from, to) vrids of its link and is demultiplexed on arrival. The
+# Transport of a process keeps the channels by the address the remote
+# process serves on, whichever side connected, so all the links
+# between two processes share one connection, one reader and one
+# writer thread, and their packets are written in the same batches.
+# The routers of a worker process share it, see
+# JobControl.create_router_in_worker. Links between co-located routers
+# move their packets through shared-memory rings, and use the channel
+# only to open the link and to ring the doorbell of a sleeping
+# consumer. With the reactor engine, the channels are LoopChannels,
+# their sockets are served by the reactor of the process instead of
+# their own threads.
+#
+# Liang Wang @ Dept. Computer Science, University of Helsinki, Finland
+# 2026.10.18 created.
+#
+
+import os
+import sys
+import time
+import errno
+import random
+import socket
+import struct
+import threading
+from Queue import Empty
+
+from fastqueue import FastQueue
+from framing import *
+from datagram import DatagramPort
+
+CHAN_BATCH = 256                     # max number of packets written at once
+CHAN_HIGH  = 4096                    # queued frames making a LoopChannel congested
+CONN_DEFER = 5                       # extra seconds the higher address waits before connecting
+
+class Channel(object):
+    """A TCP connection multiplexing virtual links. Every frame starts
+    with the tag of its link and the kind of the frame."""
+
+    reactor = None
+
+    def __init__(self, conn, addr, transport):
+        self.conn = conn
+        self.addr = addr
+        self.transport = transport
+        self.equeue = FastQueue(15000)
+        pass
+
+    def start(self):
+        """Start the reader and writer of the channel."""
+        t0 = threading.Thread(target=self.ingress)
+        t0.daemon = True
+        t0.start()
+
+        t1 = threading.Thread(target=self.egress)
+        t1.daemon = True
+        t1.start()
+        pass
+
+    def tag(self, src, dst):
+        """Tag of the packets on link src -> dst."""
+        return LINK_HDR.pack(src, dst, LINK_DATA)
+
+    def control(self, src, dst, kind, body=''):
+        """Send a control frame of link src -> dst."""
+        self.equeue.put((LINK_HDR.pack(src, dst, kind), body), True)
+        pass
+
+    def open(self, src, dst, opts=None):
+        """Ask the remote side to set up the link src -> dst, opts is a
+        dict of link options sent along."""
+        body = '\n'.join([ '%s=%s' % (k, v) for k, v in (opts or {}).items() ])
+        self.control(src, dst, LINK_OPEN, body)
+        pass
+
+    def send(self, tag, msg_hdr):
+        self.equeue.put((tag, msg_hdr), True)
+        pass
+
+    def send_many(self, tag, hdrs):
+        self.equeue.put_many([ (tag, x) for x in hdrs ], True)
+        pass
+
+    def ingress(self):
+        """Read frames and hand them to their links."""
+        reader = FrameReader(self.conn)
+        links = self.transport.links
+        while True:
+            try:
+                data = reader.read()
+                if data is None:
+                    break
+                self.dispatch(data, links)
+            except socket.error, err:
+                print "Exception:Channel.ingress():", err
+                break
+            except Exception, err:
+                print "Exception:Channel.ingress():", err
+        self.transport.remove(self)
+        pass
+
+    def dispatch(self, data, links):
+        """Hand a frame to its link, or open the link."""
+        src, dst, kind = LINK_HDR.unpack_from(data)
+        data = data[LINK_HDR.size:]
+        if kind == LINK_OPEN:
+            opts = dict([ x.split('=', 1) for x in data.tobytes().split('\n') if x ])
+            self.transport.open_link(src, dst, self, opts)
+            return
+        if kind == LINK_HELLO:
+            ip, port = data.tobytes().rsplit(':', 1)
+            self.transport.adopt(self, (ip, int(port)))
+            return
+        link = links.get((src, dst), None)
+        if link is None:
+            return
+        if kind == LINK_DATA:
+            link.on_frame(data)
+        elif kind == LINK_BELL:
+            link.drain()
+        elif kind == LINK_ROOM:
+            link.on_room()
+        elif kind == LINK_CLOSE:
+            self.transport.close_link(link)
+        pass
+
+    def egress(self):
+        """Write the queued frames of all links in batches. With coalesce
+        > 0 a small batch waits up to coalesce seconds for more packets."""
+        writer = FrameWriter(self.conn, True)
+        while True:
+            try:
+                items = self.equeue.get_many(CHAN_BATCH, True)
+                coalesce = self.transport.coalesce
+                if coalesce > 0:
+                    deadline = time.time() + coalesce
+                    while len(items) < CHAN_BATCH:
+                        t = deadline - time.time()
+                        if t <= 0 or not self.more(items, t):
+                            break
+                writer.write(items)
+            except Exception, err:
+                print "Exception:Channel.egress():", err
+        pass
+
+    def more(self, items, timeout):
+        """Wait up to timeout for more frames to append to items."""
+        try:
+            items.extend(self.equeue.get_many(CHAN_BATCH - len(items), True, timeout))
+        except Empty:
+            return False
+        return True
+
+    pass
+
+
+class LoopChannel(Channel):
+    """A Channel served by the reactor. The socket is non-blocking, the
+    frames are read when it is readable, and the queued frames are
+    written when it is writable. A write is scheduled when the first
+    frame is queued, after coalesce seconds if coalescing is on. The
+    loop thread queues without blocking, above CHAN_HIGH frames the
+    channel is congested, its links hold their packets then. The
+    socket is not read while a queue of its links is paused."""
+
+    def __init__(self, conn, addr, transport, reactor):
+        Channel.__init__(self, conn, addr, transport)
+        self.reactor = reactor
+        self.fd = conn.fileno()
+        self.reader = FrameReader(conn)
+        self.writer = FrameWriter(conn, True)
+        self.out = []                      # pieces of the batch being written
+        self.writing = False               # a write is scheduled or in progress
+        self.lock = threading.Lock()
+        pass
+
+    def start(self):
+        self.conn.setblocking(0)
+        self.reactor.register(self.fd, self.on_readable, self.on_writable)
+        pass
+
+    def enqueue(self, items):
+        if self.reactor.in_loop():
+            self.equeue.extend(items)
+        else:
+            self.equeue.put_many(items, True)
+        if self.equeue.qsize() > CHAN_HIGH:
+            self.reactor.congest(self, True)
+        self.lock.acquire()
+        if self.writing:
+            self.lock.release()
+            return
+        self.writing = True
+        self.lock.release()
+        if self.transport.coalesce > 0:
+            self.reactor.call_later(self.transport.coalesce, self.on_writable)
+        else:
+            self.reactor.call_soon(self.on_writable)
+        pass
+
+    def control(self, src, dst, kind, body=''):
+        self.enqueue([ (LINK_HDR.pack(src, dst, kind), body) ])
+        pass
+
+    def send(self, tag, msg_hdr):
+        self.enqueue([ (tag, msg_hdr) ])
+        pass
+
+    def send_many(self, tag, hdrs):
+        self.enqueue([ (tag, x) for x in hdrs ])
+        pass
+
+    def on_readable(self):
+        """Receive once, then dispatch the complete frames."""
+        try:
+            if not self.reader.receive():
+                self.close()
+                return
+        except socket.error, err:
+            if err.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return
+            print "Exception:LoopChannel.on_readable():", err
+            self.close()
+            return
+        links = self.transport.links
+        while True:
+            data = self.reader.pending()
+            if data is None:
+                break
+            try:
+                self.dispatch(data, links)
+            except Exception, err:
+                print "Exception:LoopChannel.on_readable():", err
+        pass
+
+    def on_writable(self):
+        """Write until the queue is empty or the socket is full."""
+        while True:
+            if not self.out:
+                try:
+                    items = self.equeue.get_many(CHAN_BATCH, False)
+                except Empty:
+                    self.lock.acquire()
+                    if self.equeue.empty():
+                        self.writing = False
+                        self.lock.release()
+                        self.reactor.want_write(self.fd, False)
+                        return
+                    self.lock.release()
+                    continue
+                for pieces in self.writer.batches(items):
+                    self.out.extend(pieces)
+            try:
+                self.out = self.writer.send(self.out)
+            except socket.error, err:
+                if err.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                    print "Exception:LoopChannel.on_writable():", err
+                    self.close()
+                    return
+            if self.equeue.qsize() < CHAN_HIGH // 2:
+                self.reactor.congest(self, False)
+            if self.out:
+                self.reactor.want_write(self.fd, True)
+                return
+        pass
+
+    def close(self):
+        self.reactor.congest(self, False)
+        self.reactor.unregister(self.fd)
+        self.conn.close()
+        self.transport.remove(self)
+        pass
+
+    pass
+
+
+class LocalChannel(object):
+    """Links between two routers in the same process. A packet is handed
+    to the receiving link directly, no thread, socket or copy of the
+    payload is involved. The receiver gets its own copy of the header,
+    since the sender may keep the packet, e.g. in its cache."""
+
+    reactor = None
+
+    def __init__(self, transport):
+        self.addr = None
+        self.transport = transport
+        pass
+
+    def tag(self, src, dst):
+        return (src, dst)
+
+    def control(self, src, dst, kind, body=''):
+        """Only closing a link means something here."""
+        if kind == LINK_CLOSE:
+            self.transport.close_link(self.transport.links.get((src, dst), None))
+        pass
+
+    def open(self, src, dst, opts=None):
+        self.transport.open_link(src, dst, self, {})
+        pass
+
+    def send(self, tag, msg_hdr):
+        link = self.transport.links.get(tag, None)
+        if link is not None:
+            link.on_packet(msg_hdr.copy())
+        pass
+
+    def send_many(self, tag, hdrs):
+        link = self.transport.links.get(tag, None)
+        if link is not None:
+            link.on_packets([ x.copy() for x in hdrs ])
+        pass
+
+    pass
+
+
+class Transport(object):
+    """All the channels of a process. links maps the tag of incoming
+    frames to the Link on the receiving side."""
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.links = {}
+        self.routers = {}                  # vrid -> handler of link open requests
+        self.channels = {}                 # address the remote process serves on -> Channel
+        self.addr = None                   # (ip, port) this process serves on, sent in LINK_HELLO
+        self.coalesce = 0
+        self.udp = {}                      # port -> DatagramPort of the udp transport
+        self.mutex = threading.Lock()
+        self.connecting = {}               # remote address -> Lock
+        self.serving = set()               # ports listened on
+        self.local = LocalChannel(self)    # links between routers of this process
+        self.reactor = None                # reactor serving the sockets, None for threads
+        pass
+
+    def channel(self, conn, addr):
+        """A new channel over conn, of the kind the engine uses."""
+        if self.reactor is not None:
+            return LoopChannel(conn, addr, self, self.reactor)
+        return Channel(conn, addr, self)
+
+    def is_local(self, vrid):
+        """Whether router vrid runs in this process."""
+        return vrid in self.routers
+
+    def register(self, vrid, func):
+        """func(neighbour, channel, opts) is called when the link
+        neighbour -> vrid is opened by the remote side."""
+        self.routers[vrid] = func
+        pass
+
+    def unregister(self, vrid):
+        """Router vrid is removed, no link to it is opened any more."""
+        self.routers.pop(vrid, None)
+        pass
+
+    def serve_udp(self, port, mtu=0):
+        """Return the datagram port on port, start it on first use."""
+        self.mutex.acquire()
+        try:
+            if port not in self.udp:
+                self.udp[port] = DatagramPort(port, self, mtu)
+                self.udp[port].start(self.reactor)
+        finally:
+            self.mutex.release()
+        return self.udp[port]
+
+    def attach(self, link, src, dst, channel):
+        """Bind the link src -> dst of router src to the channel."""
+        link.bind(channel, src, dst)
+        self.links[(dst, src)] = link
+        if channel.reactor is not None:
+            channel.reactor.feed(channel.fd, link.vr_iqueue)
+        pass
+
+    def open_link(self, src, dst, channel, opts):
+        """The remote side opened the link src -> dst."""
+        func = self.routers.get(dst, None)
+        if func is None:
+            print "Exception:Transport.open_link(): no router", dst
+            return
+        func(src, channel, opts)
+        pass
+
+    def close_link(self, link):
+        """Close a link attached before, its frames are dropped from now
+        on. The channel stays, the other links still use it."""
+        if link is None:
+            return
+        key = link.ends[::-1]
+        if self.links.get(key, None) is link:
+            del self.links[key]
+        link.close()
+        pass
+
+    def serve(self, port):
+        """Listen on port, every accepted connection becomes a channel.
+        The routers of a worker share the port, only the first call
+        listens, the others return at once. With a reactor the listener
+        is served by it and the call returns at once as well."""
+        self.mutex.acquire()
+        if port in self.serving:
+            self.mutex.release()
+            return
+        self.serving.add(port)
+        self.mutex.release()
+
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        s.bind( ('', port) )
+        s.listen(128)
+        if self.reactor is not None:
+            s.setblocking(0)
+            self.reactor.register(s.fileno(), lambda: self.accept(s))
+            return
+        while True:
+            self.accept(s)
+        pass
+
+    def accept(self, s):
+        """Accept the pending connections as channels."""
+        while True:
+            try:
+                conn, addr = s.accept()
+            except socket.error, err:
+                if err.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return
+                raise
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.channel(conn, addr).start()
+            if self.reactor is None:
+                return
+        pass
+
+    def connect(self, addr):
+        """Return the channel to addr, connect if there is none yet. Only
+        one thread of the process connects to the same address. Of two
+        processes with links to open towards each other, the one serving
+        on the higher address connects later, and adopts the channel of
+        the other one instead."""
+        addr = tuple(addr)
+        defer = CONN_DEFER if self.addr is not None and self.addr > addr else 0
+        self.mutex.acquire()
+        lock = self.connecting.setdefault(addr, threading.Lock())
+        self.mutex.release()
+
+        lock.acquire()
+        try:
+            channel = self.channels.get(addr, None)
+            while channel is None:
+                try:
+                    time.sleep(random.randint(1,5) + defer)
+                    defer = 0
+                    channel = self.channels.get(addr, None)
+                    if channel is not None:
+                        break                  # the remote side connected meanwhile
+                    print "connecting to %s" % (str(addr))
+                    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                    s.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+                    s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                    s.connect(addr)
+                    channel = self.channel(s, addr)
+                    channel.start()
+                    if self.addr is not None:
+                        channel.control(0, 0, LINK_HELLO, '%s:%i' % self.addr)
+                    self.mutex.acquire()
+                    self.channels.setdefault(addr, channel)
+                    self.mutex.release()
+                except Exception, err:
+                    print "Exception:Transport.connect():", err
+        finally:
+            lock.release()
+        return channel
+
+    def adopt(self, channel, addr):
+        """An accepted channel comes from the process serving on addr, the
+        links opened by this side towards that process use it as well."""
+        self.mutex.acquire()
+        channel.addr = addr
+        self.channels.setdefault(addr, channel)
+        self.mutex.release()
+        pass
+
+    def remove(self, channel):
+        """Forget a closed channel, the next connect opens a new one."""
+        self.mutex.acquire()
+        if self.channels.get(channel.addr, None) is channel:
+            del self.channels[channel.addr]
+        self.mutex.release()
+        pass
+
+    pass
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+def get_transport():
+    """Return the transport of this process."""
+    global _transport
+    _transport_lock.acquire()
+    try:
+        if _transport is None or _transport.pid != os.getpid():
+            _transport = Transport()
+    finally:
+        _transport_lock.release()
+    return _transport
+
+
+if __name__=="__main__":
+    sys.exit(0)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+#
+# Micro-benchmark of the MessageHeader codec against the ctypes header
+# it replaced. Run from the top directory: python tests/bench_header.py
+#
+# Liang Wang @ Dept. Computer Science, University of Helsinki, Finland
+# 2026.10.18 created.
+#
+
+import os
+import sys
+import timeit
+from ctypes import *
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'router'))
+from messageheader import *
+
+NUMBER  = 200000         # runs of each case
+PAYLOAD = 'x' * 1024
+
+class CtypesHeader(Structure):
+    """The old header, only the parts the cases use."""
+
+    _fields_ = [ ("type",     c_uint),
+                 ("_id",      c_ubyte * DIGEST_LEN),
+                 ("seq",      c_uint),
+                 ("control",  c_ubyte),
+                 ("_crid",    c_ubyte * DIGEST_LEN),
+                 ("src",      c_int32),
+                 ("dst",      c_int32),
+                 ("nxt",      c_int32),
+                 ("ttl",      c_ushort),
+                 ("hit",      c_ushort),
+                 ("hop",      c_ushort) ]
+
+    def __init__(self):
+        self.nxt = -1
+        self.ttl = 64
+        self.data = ''
+        pass
+
+    def send(self):
+        return buffer(self)[:] + self.data
+
+    def recv(self, bytes):
+        head_len = sizeof(self)
+        memmove(addressof(self), bytes, head_len)
+        self.data = bytes[head_len:]
+        pass
+
+    @property
+    def id(self):
+        p = cast(addressof(self._id), POINTER(c_char * DIGEST_LEN))
+        return p.contents.raw
+
+    @id.setter
+    def id(self, val):
+        memmove(addressof(self._id), val, DIGEST_LEN)
+
+    pass
+
+def request(cls):
+    hdr = cls()
+    hdr.type = MessageType.REQUEST
+    hdr.id = 'a' * DIGEST_LEN
+    hdr.seq = 12345
+    hdr.src = 3
+    hdr.dst = 42
+    hdr.data = PAYLOAD
+    return hdr
+
+def cases(cls, new, lazy):
+    """The cases, each a function of a packet as it comes off a link."""
+    hdr = request(cls)
+    def serialize(s):
+        hdr.send()
+    def parse(s):
+        h = new()
+        h.recv(s)
+        h.id; h.id; h.id
+    def forward(s):
+        h = new()
+        lazy(h, s)
+        h.hop += 1
+        h.send()
+    def inspect(s):
+        h = new()
+        lazy(h, s)
+        h.id; h.id; h.id
+        h.hop += 1
+        h.send()
+    return hdr.send(), [ ('serialize', serialize), ('parse, 3 id reads', parse),
+                         ('forward', forward), ('read id, forward', inspect) ]
+
+def run():
+    old = cases(CtypesHeader, CtypesHeader, CtypesHeader.recv)
+    new = cases(MessageHeader, blank_header, MessageHeader.wrap)
+    print "header bytes: ctypes %i, wire format %i" % (len(old[0]) - len(PAYLOAD), len(new[0]) - len(PAYLOAD))
+    print "%-20s %10s %10s %8s" % ('us per packet', 'ctypes', 'struct', 'gain')
+    for (name, f), (_, g) in zip(old[1], new[1]):
+        t0 = timeit.timeit(lambda: f(old[0]), number=NUMBER) / NUMBER * 1e6
+        t1 = timeit.timeit(lambda: g(new[0]), number=NUMBER) / NUMBER * 1e6
+        print "%-20s %10.3f %10.3f %7.2fx" % (name, t0, t1, t0 / t1)
+    pass
+
+if __name__ == "__main__":
+    run()
+    sys.exit(0)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+#
+# Tests of DatagramPort. Run from the top directory:
+# python -m unittest discover -s tests
+#
+# Liang Wang @ Dept. Computer Science, University of Helsinki, Finland
+# 2026.10.18 created.
+#
+
+import os
+import sys
+import time
+import socket
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'router'))
+import datagram
+from datagram import DatagramPort, SEG_HDR
+from framing import LINK_HDR, LINK_DATA
+from messageheader import MessageHeader, LazyHeader
+
+class Sink(object):
+    """A link keeping the packets handed to it."""
+
+    def __init__(self, lazy=False):
+        self.lazy = lazy
+        self.hdrs = []
+        pass
+
+    def on_packets(self, hdrs):
+        self.hdrs.extend(hdrs)
+        pass
+
+    pass
+
+class Transport(object):
+    def __init__(self):
+        self.links = {}
+        pass
+    pass
+
+def packet(seq, size):
+    hdr = MessageHeader()
+    hdr.seq = seq
+    hdr.id = '%020i' % seq
+    hdr.data = chr(seq % 256) * size
+    return hdr
+
+class TestDatagramPort(unittest.TestCase):
+
+    def setUp(self):
+        self.transport = Transport()
+        self.port = DatagramPort(0, self.transport, 200)
+        self.addr = ('127.0.0.1', self.port.sock.getsockname()[1])
+        self.tag = LINK_HDR.pack(3, 4, LINK_DATA)
+        self.link = self.transport.links[(3, 4)] = Sink()
+        pass
+
+    def tearDown(self):
+        self.port.sock.close()
+        datagram.UDP_REASM = 1.0
+        pass
+
+    def check(self, hdr, seq, size):
+        self.assertEqual((hdr.seq, hdr.id, hdr.data), (seq, '%020i' % seq, chr(seq % 256) * size))
+        pass
+
+    def segments(self, hdr, pid):
+        """The datagrams write() would send for the packet."""
+        data = hdr.send()
+        seg = self.port.mtu - len(self.tag) - SEG_HDR.size
+        count = (len(data) + seg - 1) // seg
+        return [ self.tag + SEG_HDR.pack(pid, i, count) + data[i * seg : (i + 1) * seg]
+                 for i in range(count) ]
+
+    def test_round_trip(self):
+        """Packets of one and of many segments come out whole, in order."""
+        sizes = [0, 10, 100, 1000, 5000, 50]
+        self.port.write([ (self.addr, self.tag, packet(i, x)) for i, x in enumerate(sizes) ])
+        while len(self.link.hdrs) < len(sizes):
+            self.port.receive(0)
+        for i, size in enumerate(sizes):
+            self.check(self.link.hdrs[i], i, size)
+        self.assertEqual(self.port.partial, {})
+        pass
+
+    def test_lazy(self):
+        self.link.lazy = True
+        self.port.write([ (self.addr, self.tag, packet(1, 10)), (self.addr, self.tag, packet(2, 1000)) ])
+        while len(self.link.hdrs) < 2:
+            self.port.receive(0)
+        for hdr in self.link.hdrs:
+            self.assertTrue(isinstance(hdr, LazyHeader))
+        self.check(self.link.hdrs[0], 1, 10)
+        self.check(self.link.hdrs[1], 2, 1000)
+        pass
+
+    def test_out_of_order(self):
+        """The segments may come in any order, a duplicate is ignored."""
+        segs = self.segments(packet(5, 700), 1)
+        self.assertTrue(len(segs) > 3)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        for x in [segs[-1]] + segs[:-1] + [segs[0]]:
+            sock.sendto(x, self.addr)
+        sock.close()
+        while not self.link.hdrs:
+            self.port.receive(0)
+        self.check(self.link.hdrs[0], 5, 700)
+        self.port.receive(socket.MSG_DONTWAIT)     # the duplicate
+        self.assertEqual(len(self.link.hdrs), 1)
+        pass
+
+    def test_lost_segment(self):
+        """A packet missing a segment is never handed over, and is purged
+        after UDP_REASM, the packets after it are not held back."""
+        datagram.UDP_REASM = 0.05
+        segs = self.segments(packet(1, 700), 1)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        for x in segs[:1] + segs[2:]:
+            sock.sendto(x, self.addr)
+        for x in self.segments(packet(2, 300), 2):
+            sock.sendto(x, self.addr)
+        sock.close()
+        while not self.link.hdrs:
+            self.port.receive(0)
+        self.check(self.link.hdrs[0], 2, 300)
+        self.assertEqual(self.port.partial.keys(), [(3, 4, 1)])
+        time.sleep(0.1)
+        self.port.receive(socket.MSG_DONTWAIT)
+        self.assertEqual(self.port.partial, {})
+        self.assertEqual(len(self.link.hdrs), 1)
+        pass
+
+    def test_unknown_link(self):
+        """A datagram of a link this process does not have is dropped."""
+        tag = LINK_HDR.pack(4, 3, LINK_DATA)
+        self.port.write([ (self.addr, tag, packet(1, 10)), (self.addr, self.tag, packet(2, 10)) ])
+        while not self.link.hdrs:
+            self.port.receive(0)
+        self.assertEqual([ x.seq for x in self.link.hdrs ], [2])
+        pass
+
+    pass
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+#
+# Tests of FastQueue. Run from the top directory:
+# python -m unittest discover -s tests
+#
+# Liang Wang @ Dept. Computer Science, University of Helsinki, Finland
+# 2026.10.18 created.
+#
+
+import os
+import sys
+import time
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'router'))
+from fastqueue import FastQueue, Empty, Full
+
+class TestFastQueue(unittest.TestCase):
+
+    def test_fifo(self):
+        q = FastQueue()
+        for i in range(10):
+            q.put(i)
+        q.put_many(range(10, 20))
+        self.assertEqual(q.qsize(), 20)
+        self.assertEqual([ q.get() for i in range(5) ], range(5))
+        self.assertEqual(q.get_many(10), range(5, 15))
+        self.assertEqual(q.get_many(10), range(15, 20))
+        self.assertTrue(q.empty())
+        pass
+
+    def test_bounds(self):
+        q = FastQueue(4)
+        self.assertEqual(q.put_some(range(3)), 3)
+        self.assertEqual(q.put_some(range(3, 6)), 1)
+        self.assertEqual(q.put_some([6]), 0)
+        self.assertTrue(q.full())
+        self.assertRaises(Full, q.put_nowait, 7)
+        self.assertRaises(Full, q.put_many, [7], True, 0.01)
+        q.extend([7, 8])
+        self.assertEqual(q.get_many(10, False), [0, 1, 2, 3, 7, 8])
+        self.assertRaises(Empty, q.get_nowait)
+        self.assertRaises(Empty, q.get_many, 1, False)
+        pass
+
+    def test_timeout(self):
+        q = FastQueue()
+        t = time.time()
+        self.assertRaises(Empty, q.get, True, 0.05)
+        self.assertTrue(time.time() - t >= 0.05)
+        pass
+
+    def test_blocking(self):
+        """put_many fills the room a consumer frees, in order, and a
+        blocked get wakes up on a put."""
+        q = FastQueue(8)
+        got = []
+        def consume():
+            while len(got) < 100:
+                got.extend(q.get_many(3))
+        t = threading.Thread(target=consume)
+        t.start()
+        q.put_many(range(100))
+        t.join(5)
+        self.assertFalse(t.is_alive())
+        self.assertEqual(got, range(100))
+        t = threading.Timer(0.05, q.put, (1,))
+        t.start()
+        self.assertEqual(q.get(True, 5), 1)
+        pass
+
+    pass
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+#
+# Tests of FrameReader and FrameWriter. Run from the top directory:
+# python -m unittest discover -s tests
+#
+# Liang Wang @ Dept. Computer Science, University of Helsinki, Finland
+# 2026.10.18 created.
+#
+
+import os
+import sys
+import errno
+import random
+import socket
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'router'))
+from framing import FrameReader, FrameWriter, LINK_HDR, LINK_DATA, WRITE_LEN
+from messageheader import MessageHeader
+
+def packets(sizes):
+    hdrs = []
+    for i, size in enumerate(sizes):
+        hdr = MessageHeader()
+        hdr.seq = i
+        hdr.src = i % 7
+        hdr.dst = -1
+        hdr.id = ('%020i' % i) if i % 2 else hdr.id
+        hdr.data = chr(i % 256) * size
+        hdrs.append(hdr)
+    return hdrs
+
+class TestFraming(unittest.TestCase):
+
+    def setUp(self):
+        self.a, self.b = socket.socketpair()
+        pass
+
+    def tearDown(self):
+        self.a.close()
+        self.b.close()
+        pass
+
+    def check(self, frame, hdr, tag=''):
+        self.assertEqual(frame[:len(tag)].tobytes(), tag)
+        got = MessageHeader()
+        got.recv(frame[len(tag):])
+        self.assertEqual((got.seq, got.src, got.dst, got.id, got.data),
+                         (hdr.seq, hdr.src, hdr.dst, hdr.id, hdr.data))
+        pass
+
+    def test_round_trip(self):
+        """Frames of all sizes, some bigger than the receive buffer,
+        which grows, come out as they went in, then EOF."""
+        sizes = [ random.choice([0, 1, 100, 5000, 70000]) for i in range(300) ]
+        hdrs = packets(sizes)
+        tag = LINK_HDR.pack(3, 4, LINK_DATA)
+        def write():
+            writer = FrameWriter(self.a, True)
+            writer.write([ (tag, x) for x in hdrs ] + [ (tag, 'raw') ])
+            self.a.shutdown(socket.SHUT_WR)
+        t = threading.Thread(target=write)
+        t.start()
+        reader = FrameReader(self.b, 1024)
+        for hdr in hdrs:
+            self.check(reader.read(), hdr, tag)
+        self.assertEqual(reader.read().tobytes(), tag + 'raw')
+        self.assertEqual(reader.read(), None)
+        t.join(5)
+        pass
+
+    def test_batches(self):
+        """A batch is cut into writes of about WRITE_LEN bytes."""
+        hdrs = packets([WRITE_LEN // 4] * 10)
+        batches = list(FrameWriter(self.a).batches(hdrs))
+        self.assertEqual(len(batches), 3)
+        self.assertEqual(sum([ len(x) for x in batches ]), 4 * 10)
+        pass
+
+    def test_nonblocking(self):
+        """send() takes what the socket has room for and gives back the
+        rest, receive() and pending() hand out the frames as they are
+        complete, a frame straddling two receives included."""
+        self.a.setblocking(False)
+        self.b.setblocking(False)
+        hdrs = packets([ random.randint(0, 30000) for i in range(100) ])
+        writer = FrameWriter(self.a)
+        reader = FrameReader(self.b, 4096)
+        out = [ x for pieces in writer.batches(hdrs) for x in pieces ]
+        got = 0
+        while got < len(hdrs):
+            if out:
+                try:
+                    out = writer.send(out)
+                except socket.error, err:
+                    self.assertEqual(err.args[0], errno.EAGAIN)
+            try:
+                self.assertTrue(reader.receive())
+            except socket.error, err:
+                self.assertEqual(err.args[0], errno.EAGAIN)
+            while True:
+                frame = reader.pending()
+                if frame is None:
+                    break
+                self.check(frame, hdrs[got])
+                got += 1
+        self.assertEqual(out, [])
+        self.assertRaises(socket.error, reader.receive)
+        pass
+
+    pass
+
+
+if __name__ == "__main__":
+    unittest.main()
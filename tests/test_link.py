@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+#
+# Tests of the link model of Link. Run from the top directory:
+# python -m unittest discover -s tests
+#
+# Liang Wang @ Dept. Computer Science, University of Helsinki, Finland
+# 2026.10.18 created.
+#
+
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'router'))
+from link import Link
+from fastqueue import FastQueue
+from messageheader import MessageHeader
+
+class Recorder(object):
+    """A router queue keeping the time each packet arrives at."""
+
+    def __init__(self):
+        self.items = []
+        pass
+
+    def put_some(self, items):
+        now = time.time()
+        self.items.extend([ (now, x) for x in items ])
+        return len(items)
+
+    pass
+
+def packets(n, size):
+    hdrs = []
+    for i in range(n):
+        hdr = MessageHeader()
+        hdr.seq = i
+        hdr.data = 'x' * size
+        hdrs.append(hdr)
+    return hdrs
+
+def link(bandwidth, delay, q, backlog=0):
+    p = {'weight': 1, 'bandwidth': bandwidth, 'delay': delay, 'lossrate': 0.0}
+    return Link(p, q, backlog)
+
+class TestLinkModel(unittest.TestCase):
+
+    def test_serialization(self):
+        """A packet arrives once the ones ahead of it and itself are
+        serialized, plus the propagation delay."""
+        q = Recorder()
+        l = link(10**5, 0.02, q)
+        t = time.time()
+        l.on_packets(packets(10, 1000))
+        time.sleep(0.3)
+        self.assertEqual([ x.seq for t1, x in q.items ], range(10))
+        for k, (t1, x) in enumerate(q.items):
+            expect = t + (k + 1) * 0.01 + 0.02
+            self.assertTrue(expect <= t1 < expect + 0.02, (k, t1 - expect))
+        self.assertEqual(l.drops, 0)
+        pass
+
+    def test_backlog(self):
+        """The backlog is unbounded by default, a bounded one drops the
+        packets beyond it and counts them."""
+        q = Recorder()
+        l = link(10**4, 0.0, q)
+        l.on_packets(packets(20, 100))
+        self.assertEqual(l.drops, 0)
+        l = link(10**4, 0.0, q, 550)
+        l.on_packets(packets(20, 100))
+        self.assertEqual(l.drops, 15)
+        pass
+
+    def test_untimed(self):
+        """A link without delay nor bandwidth hands the packets over at
+        once, a full router queue drops the others."""
+        q = FastQueue(3)
+        l = link(float('inf'), 0.0, q)
+        self.assertFalse(l.timed)
+        l.on_packets(packets(5, 10))
+        self.assertEqual([ x.seq for x in q.get_many(10, False) ], range(3))
+        self.assertEqual(l.drops, 2)
+        pass
+
+    pass
+
+
+if __name__ == "__main__":
+    unittest.main()
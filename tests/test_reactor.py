@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+#
+# Tests of LoopQueue. Run from the top directory:
+# python -m unittest discover -s tests
+#
+# Liang Wang @ Dept. Computer Science, University of Helsinki, Finland
+# 2026.10.18 created.
+#
+
+import os
+import sys
+import time
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'router'))
+from reactor import Reactor, LoopQueue
+
+class TestLoopQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.reactor = Reactor()
+        self.reactor.start()
+        self.batches = []
+        self.rfd, self.wfd = os.pipe()
+        pass
+
+    def tearDown(self):
+        os.close(self.rfd)
+        os.close(self.wfd)
+        pass
+
+    def queue(self, maxsize=0, batch=4, downstream=None):
+        return LoopQueue(self.reactor, self.batches.append, None, maxsize, batch, downstream)
+
+    def sync(self, func, *args):
+        """Run func in the loop thread and wait for it."""
+        done = threading.Event()
+        result = []
+        def call():
+            result.append(func(*args))
+            done.set()
+        self.reactor.call_soon(call)
+        self.assertTrue(done.wait(1))
+        return result[0]
+
+    def consumed(self):
+        return [ x for hdrs in self.batches for x in hdrs ]
+
+    def test_consume(self):
+        """The items are consumed in order, in batches."""
+        q = self.queue()
+        for i in range(10):
+            q.put_many(range(i * 10, i * 10 + 10))
+        time.sleep(0.1)
+        self.assertEqual(self.consumed(), range(100))
+        self.assertTrue(max([ len(x) for x in self.batches ]) <= 4)
+        pass
+
+    def test_stall(self):
+        """A stalled queue keeps its items until its last output resumes."""
+        q = self.queue()
+        self.sync(q.stall, 'a', True)
+        self.sync(q.stall, 'b', True)
+        q.put_many(range(10))
+        time.sleep(0.05)
+        self.assertEqual(self.batches, [])
+        self.sync(q.stall, 'a', False)
+        time.sleep(0.05)
+        self.assertEqual(self.batches, [])
+        self.sync(q.stall, 'b', False)
+        time.sleep(0.05)
+        self.assertEqual(self.consumed(), range(10))
+        self.assertTrue(q.empty())
+        pass
+
+    def test_pause(self):
+        """Over half full, the queue pauses the inputs feeding it, once
+        drained it resumes them."""
+        q = self.queue(8)
+        self.reactor.feed(self.rfd, q)
+        self.sync(q.stall, 'a', True)
+        q.put_many(range(4))
+        self.assertFalse(self.reactor.is_paused(q))
+        q.put_many(range(4, 6))
+        self.assertTrue(self.reactor.is_paused(q))
+        self.assertTrue(self.rfd in self.reactor.blocked)
+        self.sync(q.stall, 'a', False)
+        time.sleep(0.05)
+        self.assertEqual(self.consumed(), range(6))
+        self.assertFalse(self.reactor.is_paused(q))
+        self.assertFalse(self.rfd in self.reactor.blocked)
+        pass
+
+    def test_downstream(self):
+        """The queue stops consuming while its downstream is paused."""
+        q = self.queue(downstream='d')
+        self.reactor.pause('d', True)
+        q.put_many(range(10))
+        time.sleep(0.05)
+        self.assertEqual(self.batches, [])
+        self.reactor.pause('d', False)
+        time.sleep(0.05)
+        self.assertEqual(self.consumed(), range(10))
+        pass
+
+    def test_put_some(self):
+        """Other threads put what the queue has room for, the loop thread
+        puts all the items."""
+        q = self.queue(4)
+        self.sync(q.stall, 'a', True)
+        self.assertEqual(q.put_some(range(6)), 4)
+        self.assertEqual(self.sync(q.put_some, range(4, 10)), 6)
+        self.assertEqual(q.qsize(), 10)
+        self.sync(q.stall, 'a', False)
+        time.sleep(0.05)
+        self.assertEqual(self.consumed(), range(10))
+        pass
+
+    def test_close(self):
+        """Closing drops the items left and the ones put later."""
+        q = self.queue()
+        self.sync(q.stall, 'a', True)
+        q.put_many(range(10))
+        q.close()
+        self.assertEqual(q.put_some(range(5)), 0)
+        q.put_many(range(5))
+        self.sync(q.stall, 'a', False)
+        time.sleep(0.05)
+        self.assertEqual(self.batches, [])
+        self.assertTrue(q.empty())
+        pass
+
+    pass
+
+
+if __name__ == "__main__":
+    unittest.main()
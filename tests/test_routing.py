@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+#
+# Tests of the symmetric routing, checked by brute force on small random
+# graphs. Run from the top directory:
+# python -m unittest discover -s tests
+#
+# Liang Wang @ Dept. Computer Science, University of Helsinki, Finland
+# 2026.10.18 created.
+#
+
+import os
+import sys
+import random
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'router'))
+from routing import *
+
+def random_graph(rnd, n, p, maxw):
+    """Small weights, so there are many ties of distance and hops."""
+    adj = dict( (x, {}) for x in range(1, n + 1) )
+    for x in range(1, n + 1):
+        for y in range(x + 1, n + 1):
+            if rnd.random() < p:
+                w = rnd.randint(1, maxw)
+                adj[x][y] = adj[y][x] = w
+    return adj
+
+def floyd(adj):
+    dist = dict( ((x, y), 0 if x == y else adj[x].get(y, INF)) for x in adj for y in adj )
+    for k in adj:
+        for x in adj:
+            for y in adj:
+                if dist[x, k] + dist[k, y] < dist[x, y]:
+                    dist[x, y] = dist[x, k] + dist[k, y]
+    return dist
+
+def best_paths(adj, src):
+    """Try every simple path from src, keep the one of the least
+    (distance, hops, link mask) to each router."""
+    links = link_index(adj)
+    best = {}
+    def walk(path, d, mask):
+        x = path[-1]
+        key = (d, len(path) - 1, mask)
+        if x not in best or key < best[x][0]:
+            best[x] = (key, list(path))
+        for y, w in adj[x].items():
+            if y not in path:
+                path.append(y)
+                walk(path, d + w, mask | 1 << links[x][y])
+                path.pop()
+    walk([src], 0, 0)
+    return dict( (x, v[1]) for x, v in best.items() )
+
+class TestRouting(unittest.TestCase):
+
+    def graphs(self):
+        rnd = random.Random(7)
+        for i in range(30):
+            yield random_graph(rnd, rnd.randint(2, 8), rnd.choice([0.3, 0.5, 0.8]), rnd.choice([1, 2, 3]))
+
+    def test_brute_force(self):
+        """The distances are the shortest ones, the paths are the least
+        ones in the order of symmetric_dijkstra, and the path from x to y
+        is the reverse of the path from y to x."""
+        for adj in self.graphs():
+            dist = floyd(adj)
+            store = PathStore.build(adj, 1)
+            paths = SymmetricPaths(adj)
+            for x in adj:
+                d, prev = symmetric_dijkstra(adj, x)
+                best = best_paths(adj, x)
+                self.assertEqual(sorted(d), sorted(best))
+                for y in adj:
+                    self.assertEqual(d.get(y, INF), dist[x, y])
+                    path = best.get(y, None)
+                    if x == y:
+                        self.assertEqual(store.get((x, y)), None)
+                        continue
+                    self.assertEqual(store.get((x, y)), path)
+                    self.assertEqual(paths.get((x, y)), path)
+                    self.assertEqual(store.hops(x, y), len(path) - 1 if path else -1)
+                    if path is not None:
+                        self.assertEqual(store[y, x], path[::-1])
+                        self.assertEqual(store.next_hop(x, y), path[1])
+                    else:
+                        self.assertFalse((x, y) in store)
+                        self.assertEqual(store.next_hop(x, y), -1)
+        pass
+
+    def test_rows(self):
+        """pred_row() is the row of pred(), load_row() gives the same next
+        hops as the paths."""
+        for adj in self.graphs():
+            store = PathStore.build(adj, 1)
+            for x in adj:
+                self.assertEqual(list(store.pred_row(x)), [ store.pred(x, y) for y in store.routers ])
+                rtable = {}
+                store.load_row(x, rtable)
+                self.assertEqual(sorted(rtable), sorted(adj))
+                for y in adj:
+                    path = store.get((x, y))
+                    self.assertEqual(rtable[y], path[1] if path else -1)
+        pass
+
+    def test_save_load(self):
+        """A saved store maps back to the same bytes, a parallel build
+        gives the same rows."""
+        adj = random_graph(random.Random(7), 30, 0.2, 3)
+        store = PathStore.build(adj, 1)
+        self.assertEqual(PathStore.build(adj, 2).buf, store.buf)
+        fn = tempfile.mktemp()
+        try:
+            store.save(fn)
+            self.assertTrue(is_rtable_file(fn))
+            saved = PathStore.load(fn)
+            self.assertEqual(saved.buf[:], str(store.buf))
+            self.assertEqual(len(saved), 30 * 29)
+            for x in adj:
+                for y in adj:
+                    self.assertEqual(saved.get((x, y)), store.get((x, y)))
+        finally:
+            os.remove(fn)
+        pass
+
+    pass
+
+
+if __name__ == "__main__":
+    unittest.main()
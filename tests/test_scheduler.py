@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+#
+# Tests of TimingWheel. Run from the top directory:
+# python -m unittest discover -s tests
+#
+# Liang Wang @ Dept. Computer Science, University of Helsinki, Finland
+# 2026.10.18 created.
+#
+
+import os
+import sys
+import time
+import random
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'router'))
+from fastqueue import FastQueue
+from scheduler import TimingWheel
+
+class Recorder(object):
+    """A queue keeping the time each item arrives at."""
+
+    def __init__(self):
+        self.items = []
+        pass
+
+    def put_some(self, items):
+        now = time.time()
+        self.items.extend([ (now, x) for x in items ])
+        return len(items)
+
+    pass
+
+class TestTimingWheel(unittest.TestCase):
+
+    def test_cascade(self):
+        """Every entry comes out at its own tick, also the ones that go
+        through the higher levels, on a small wheel of 3 levels of 4
+        slots driven by hand."""
+        w = TimingWheel(1.0, 2, 3)
+        w.current = 0
+        expires = range(1, 64) + [ random.randint(1, 63) for i in range(100) ]
+        for t in expires:
+            w.insert(t, (None, t))
+            w.count += 1
+        for t in range(1, 64):
+            due = w.advance(t)
+            self.assertEqual([ x for q, x in due ], [t] * expires.count(t))
+        self.assertEqual(w.count, 0)
+        pass
+
+    def test_horizon(self):
+        """An entry beyond the last level fires at the end of the wheel."""
+        w = TimingWheel(1.0, 2, 3)
+        w.current = 0
+        w.insert(1000, (None, 'x'))
+        w.count += 1
+        self.assertEqual(w.advance(62), [])
+        self.assertEqual(w.advance(63), [(None, 'x')])
+        pass
+
+    def test_timer(self):
+        """The timer thread never delivers early, nor much later than a
+        few ticks, and keeps the order of expiry."""
+        w = TimingWheel()
+        w.start()
+        q = Recorder()
+        now = time.time()
+        due = sorted([ now + random.uniform(0.01, 0.1) for i in range(200) ])
+        for t in due:
+            w.schedule(t, q, t)
+        time.sleep(0.3)
+        self.assertEqual([ x for t, x in q.items ], due)
+        for t, x in q.items:
+            self.assertTrue(x <= t < x + 0.05, t - x)
+        pass
+
+    def test_full_queue(self):
+        """The items a full queue has no room for are dropped."""
+        w = TimingWheel()
+        w.start()
+        q = FastQueue(2)
+        t = time.time() + 0.01
+        for i in range(5):
+            w.schedule(t, q, i)
+        time.sleep(0.1)
+        self.assertEqual(q.get_many(10, False), [0, 1])
+        self.assertEqual(w.count, 0)
+        pass
+
+    pass
+
+
+if __name__ == "__main__":
+    unittest.main()
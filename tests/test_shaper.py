@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+#
+# Tests of TokenBucket. Run from the top directory:
+# python -m unittest discover -s tests
+#
+# Liang Wang @ Dept. Computer Science, University of Helsinki, Finland
+# 2026.10.18 created.
+#
+
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'router'))
+from shaper import TokenBucket, BURST_TIME
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_unshaped(self):
+        for rate in (0, float('inf')):
+            tb = TokenBucket(rate)
+            self.assertFalse(tb.enabled)
+            t = time.time()
+            for i in range(1000):
+                tb.consume(10**6)
+            self.assertEqual(tb.wait_time(10**9), 0.0)
+            self.assertTrue(time.time() - t < 0.1)
+        pass
+
+    def test_burst(self):
+        self.assertEqual(TokenBucket(10**6).burst, 10**6 * BURST_TIME)
+        tb = TokenBucket(10**4, 1000)
+        self.assertEqual(tb.wait_time(1000), 0.0)
+        tb.consume(1000)
+        self.assertAlmostEqual(tb.wait_time(500), 0.05, 2)
+        pass
+
+    def test_rate(self):
+        """Once the bucket is empty, packets go out at the rate."""
+        tb = TokenBucket(10**5, 1000)
+        t = time.time()
+        for i in range(21):
+            tb.consume(1000)
+        elapsed = time.time() - t
+        self.assertTrue(0.19 <= elapsed < 0.4, elapsed)
+        pass
+
+    def test_debt(self):
+        """A packet bigger than the bucket is not held back, the
+        following packets pay for it."""
+        tb = TokenBucket(10**4, 100)
+        self.assertEqual(tb.wait_time(1000), 0.0)
+        tb.consume(1000)
+        self.assertTrue(tb.tokens < 0)
+        self.assertAlmostEqual(tb.wait_time(100), 0.1, 2)
+        pass
+
+    pass
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+#
+# Tests of ShmRing. Run from the top directory:
+# python -m unittest discover -s tests
+#
+# Liang Wang @ Dept. Computer Science, University of Helsinki, Finland
+# 2026.10.18 created.
+#
+
+import os
+import sys
+import random
+import unittest
+from collections import deque
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'router'))
+from shmring import ShmRing, RLEN
+from messageheader import MessageHeader, LazyHeader
+
+def packet(seq, size):
+    hdr = MessageHeader()
+    hdr.seq = seq
+    hdr.id = '%020i' % seq
+    hdr.data = chr(seq % 256) * size
+    return hdr
+
+class TestShmRing(unittest.TestCase):
+
+    def setUp(self):
+        self.tx = ShmRing.create('test', 1024)
+        self.rx = ShmRing(self.tx.path)     # the consumer maps the same file
+        pass
+
+    def tearDown(self):
+        self.rx.close()
+        self.tx.close()
+        pass
+
+    def check(self, hdr, seq, size):
+        self.assertEqual((hdr.seq, hdr.id, hdr.data), (seq, '%020i' % seq, chr(seq % 256) * size))
+        pass
+
+    def test_straddle(self):
+        """A record that does not fit in the rest of the ring goes to the
+        front, the end is skipped."""
+        size = 1024 // 3 - RLEN.size - len(packet(1, 0).pack())
+        for i in (1, 2):
+            self.assertTrue(self.tx.push(packet(i, size)))
+        self.assertTrue(self.tx.tail + 1024 // 3 > 1024)
+        self.check(self.rx.pop(), 1, size)
+        self.assertTrue(self.tx.push(packet(3, size)))
+        self.assertTrue(self.tx.tail > 1024)
+        self.check(self.rx.pop(), 2, size)
+        self.check(self.rx.pop(True), 3, size)
+        self.assertEqual(self.rx.pop(), None)
+        self.assertEqual(self.rx.head, self.tx.tail)
+        pass
+
+    def test_wrap_around(self):
+        """Random sizes, many turns of the ring, a model queue tells what
+        must come out."""
+        model = deque()
+        seq = 0
+        for i in range(5000):
+            if random.random() < 0.5:
+                size = random.randint(0, 300)
+                if self.tx.push(packet(seq, size)):
+                    model.append((seq, size))
+                else:
+                    self.assertTrue(len(model) > 0)
+                seq += 1
+            else:
+                hdr = self.rx.pop(random.random() < 0.5)
+                if not model:
+                    self.assertEqual(hdr, None)
+                    continue
+                self.check(hdr, *model.popleft())
+        self.assertTrue(self.tx.tail > 50 * 1024)
+        while model:
+            self.check(self.rx.pop(), *model.popleft())
+        self.assertEqual(self.rx.pop(), None)
+        pass
+
+    def test_lazy(self):
+        self.tx.push(packet(7, 10))
+        hdr = self.rx.pop(True)
+        self.assertTrue(isinstance(hdr, LazyHeader))
+        self.check(hdr, 7, 10)
+        pass
+
+    def test_full(self):
+        """A full ring refuses a push, block() tells the consumer to let
+        the producer know once it has popped. The record after the last
+        one needs the padding at the end of the ring as well."""
+        n = 1
+        while self.tx.push(packet(n, 100)):
+            n += 1
+        self.assertTrue(n > 1)
+        self.assertTrue(self.tx.block())
+        self.check(self.rx.pop(), 1, 100)
+        self.assertTrue(self.rx.unblock())
+        self.assertFalse(self.rx.unblock())
+        self.check(self.rx.pop(), 2, 100)
+        self.assertTrue(self.tx.push(packet(n, 100)))
+        n += 1
+        while self.tx.push(packet(n, 100)):
+            n += 1
+        self.check(self.rx.pop(), 3, 100)
+        self.assertFalse(self.tx.block())     # popped in the meantime
+        self.assertFalse(self.rx.unblock())
+        pass
+
+    def test_doorbell(self):
+        """The producer rings the doorbell only for a sleeping consumer."""
+        self.assertTrue(self.tx.wake())       # a new ring starts waiting
+        self.assertFalse(self.tx.wake())
+        self.assertTrue(self.rx.sleep())
+        self.tx.push(packet(0, 0))
+        self.assertTrue(self.tx.wake())
+        self.assertFalse(self.rx.sleep())     # pushed in the meantime
+        self.assertFalse(self.tx.wake())
+        pass
+
+    def test_fits(self):
+        self.assertTrue(self.tx.fits(packet(0, 300)))
+        self.assertFalse(self.tx.fits(packet(0, 500)))
+        pass
+
+    pass
+
+
+if __name__ == "__main__":
+    unittest.main()